@@ -0,0 +1,6 @@
+"""Offline benchmarks of the bot, no Google or Telegram access is needed.
+
+Run from the app directory:
+
+    python -m benchmarks.sheets --members 1000 10000 100000 500000
+"""
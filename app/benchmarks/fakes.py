@@ -0,0 +1,361 @@
+"""In-process fakes of the Sheets v4 service and the Telegram bot."""
+
+import asyncio
+import importlib.util
+import json
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+from types import SimpleNamespace
+
+from aiohttp import web
+
+BENCH_CHAT_ID = -1001
+BENCH_SPREADSHEET_ID = 'bench'
+
+
+def install_offline_config(**options):
+    """Load `default.config.py` as the `config` module and keep the state in memory.
+
+    Has to be called before `src.groups` or `src.restricted` are imported,
+    so the benchmarks never touch the real groups, spreadsheets and state.
+    """
+    path = Path(__file__).resolve().parent.parent.joinpath('default.config.py')
+    spec = importlib.util.spec_from_file_location('config', path)
+    config = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(config)
+    config.BOT_TOKEN = '123456:' + 'A' * 35
+    config.GROUP_CHAT_ID = BENCH_CHAT_ID
+    config.SPREADSHEET_ID = BENCH_SPREADSHEET_ID
+    for name, value in options.items():
+        setattr(config, name, value)
+    sys.modules['config'] = config
+
+    import src.utils
+    src.utils.STATE_DB = ':memory:'
+    return config
+
+
+def member_rows(count, restricted_every=100, deposit_every=250):
+    """Sheet rows of `count` members with the header.
+
+    Every `restricted_every` member is restricted and every `deposit_every`
+    member has a deposit, so about 1.4% of the members are restricted.
+    """
+    rows = [['id', 'name', 'username', 'join_date', 'deposit', 'restricted']]
+    for i in range(count):
+        rows.append([
+            5_000_000_000 + i,
+            'Member {}'.format(i),
+            'member{}'.format(i),
+            '2024-01-01 00:00:00',
+            100 if i % deposit_every == 0 else 0,
+            1 if i % restricted_every == 0 or i % deposit_every == 0 else 0,
+        ])
+    return rows
+
+
+def _column_number(letters):
+    number = 0
+    for letter in letters:
+        number = number * 26 + ord(letter) - ord('A') + 1
+    return number - 1
+
+
+def parse_range(range_name):
+    """Return (first column, last column, first row, last row or None) of an A1 range."""
+    range_name = range_name.split('!')[-1]
+    match = re.fullmatch(r'([A-Z]+)(\d*)(?::([A-Z]+)(\d*))?', range_name)
+    first_column, first_row, last_column, last_row = match.groups()
+    if last_column is None:
+        # Single cell 'F2' or column 'F'
+        last_column = first_column
+        last_row = first_row
+    return (
+        _column_number(first_column),
+        _column_number(last_column),
+        int(first_row) if first_row else 1,
+        int(last_row) if last_row else None,
+    )
+
+
+def _trim(values):
+    end = len(values)
+    while end and values[end - 1] == '':
+        end -= 1
+    return values[:end]
+
+
+class FakeRequest:
+
+    def __init__(self, sheet, method, func, body=None):
+        self.sheet = sheet
+        self.method = method
+        self.func = func
+        self.body = body
+
+    def execute(self, http=None, num_retries=0):
+        start = time.perf_counter()
+        if self.sheet.latency:
+            time.sleep(self.sheet.latency)
+        result = self.func()
+        with self.sheet.lock:
+            self.sheet.calls[self.method] += 1
+            self.sheet.api_time += time.perf_counter() - start
+            if self.sheet.record_payloads:
+                self.sheet.payloads.append((self.body, result))
+        return result
+
+
+class FakeValues:
+
+    def __init__(self, sheet):
+        self.sheet = sheet
+
+    def _read(self, range_name, render_option='FORMATTED_VALUE'):
+        first_column, last_column, first_row, last_row = parse_range(range_name)
+        rows = self.sheet.rows[first_row - 1:last_row]
+        if render_option == 'FORMATTED_VALUE':
+            values = [_trim([str(value) for value in row[first_column:last_column + 1]]) for row in rows]
+        else:
+            values = [_trim(row[first_column:last_column + 1]) for row in rows]
+        # Empty trailing rows are omitted like the trailing cells
+        while values and values[-1] == []:
+            values.pop()
+        result = {'range': range_name, 'majorDimension': 'ROWS'}
+        if values:
+            result['values'] = values
+        return result
+
+    def _read_columns(self, range_name, render_option='FORMATTED_VALUE'):
+        first_column, last_column, first_row, last_row = parse_range(range_name)
+        rows = self.sheet.rows[first_row - 1:last_row]
+        columns = []
+        for column in range(first_column, last_column + 1):
+            values = [row[column] if column < len(row) else '' for row in rows]
+            if render_option == 'FORMATTED_VALUE':
+                values = [str(value) for value in values]
+            columns.append(_trim(values))
+        while columns and columns[-1] == []:
+            columns.pop()
+        result = {'range': range_name, 'majorDimension': 'COLUMNS'}
+        if columns:
+            result['values'] = columns
+        return result
+
+    def _write(self, range_name, values):
+        first_column, _, first_row, _ = parse_range(range_name)
+        rows = self.sheet.rows
+        for row_number, row_values in enumerate(values, first_row):
+            while len(rows) < row_number:
+                rows.append([])
+            row = rows[row_number - 1]
+            if len(row) < first_column + len(row_values):
+                row.extend([''] * (first_column + len(row_values) - len(row)))
+            row[first_column:first_column + len(row_values)] = row_values
+
+    def get(self, spreadsheetId, range, valueRenderOption='FORMATTED_VALUE', **kwargs):
+        return FakeRequest(self.sheet, 'get', lambda: self._read(range, valueRenderOption))
+
+    def batchGet(self, spreadsheetId, ranges, majorDimension='ROWS', valueRenderOption='FORMATTED_VALUE', **kwargs):
+        def batch_get():
+            value_ranges = []
+            for range_name in ranges:
+                if majorDimension == 'COLUMNS':
+                    value_range = self._read_columns(range_name, valueRenderOption)
+                else:
+                    value_range = self._read(range_name, valueRenderOption)
+                value_ranges.append(value_range)
+            return {'spreadsheetId': spreadsheetId, 'valueRanges': value_ranges}
+
+        return FakeRequest(self.sheet, 'batchGet', batch_get)
+
+    def update(self, spreadsheetId, range, valueInputOption, body):
+        def update():
+            self._write(range, body['values'])
+            return {'updatedRange': range, 'updatedRows': len(body['values'])}
+
+        return FakeRequest(self.sheet, 'update', update, body)
+
+    def batchUpdate(self, spreadsheetId, body):
+        def batch_update():
+            for value_range in body['data']:
+                self._write(value_range['range'], value_range['values'])
+            return {'totalUpdatedCells': sum(len(value_range['values']) for value_range in body['data'])}
+
+        return FakeRequest(self.sheet, 'batchUpdate', batch_update, body)
+
+    def append(self, spreadsheetId, range, valueInputOption, insertDataOption, body):
+        def append():
+            rows = self.sheet.rows
+            while rows and not any(value != '' for value in rows[-1]):
+                rows.pop()
+            first_row = len(rows) + 1
+            rows.extend(list(row) for row in body['values'])
+            return {'updates': {'updatedRange': 'Sheet1!A{}:F{}'.format(first_row, len(rows))}}
+
+        return FakeRequest(self.sheet, 'append', append, body)
+
+
+class FakeSheetsService:
+
+    def __init__(self, rows, latency=0.0):
+        """Sheets v4 service keeping one sheet in memory.
+
+        Only the `spreadsheets().values()` methods used by `ServiceAccount` are provided.
+
+        :param rows: list[list]  Sheet rows with the header.
+        :param latency: float  Seconds every request takes, the network round trip.
+        """
+        self.rows = rows
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.calls = Counter()
+        # Time spent inside the fake, to be told apart from the time of the client code
+        self.api_time = 0.0
+        # Request bodies and responses are kept while it is set, see `payload_bytes`
+        self.record_payloads = False
+        self.payloads = []
+
+    def reset_stats(self):
+        self.calls.clear()
+        self.api_time = 0.0
+        self.payloads.clear()
+
+    def payload_bytes(self):
+        """Return the JSON size of the recorded request bodies and responses.
+
+        The sizes are computed here rather than in the calls, so the
+        serialization is not counted in the measured allocations.
+        """
+        sent = sum(len(json.dumps(body)) for body, _ in self.payloads if body is not None)
+        received = sum(len(json.dumps(result)) for _, result in self.payloads)
+        return sent, received
+
+    def spreadsheets(self):
+        return SimpleNamespace(values=lambda: FakeValues(self))
+
+
+def offline_service_account(service, max_workers=None):
+    """Return an `AsyncServiceAccount` calling the fake service instead of Google."""
+    from src.google_spreadsheets import AsyncServiceAccount, ServiceAccount
+    from src.utils import SHEETS_MAX_WORKERS, SCOPES
+
+    sync = ServiceAccount.__new__(ServiceAccount)
+    sync.credentials = SimpleNamespace(token='offline', expiry=datetime.utcnow() + timedelta(days=1))
+    sync.scopes = SCOPES
+    sync.service = service
+    sync._local = threading.local()
+    sync._http = lambda: None
+    sync.guard = None
+
+    sa = AsyncServiceAccount.__new__(AsyncServiceAccount)
+    sa.sync = sync
+    sa._executor = ThreadPoolExecutor(max_workers=max_workers or SHEETS_MAX_WORKERS, thread_name_prefix='sheets')
+    return sa
+
+
+def install_service_account(sa):
+    """Make `get_service_account()` return `sa`, call it before the bot modules are imported."""
+    from src import google_spreadsheets
+    from src.utils import SERVICE_ACCOUNT_CREDENTIALS, SCOPES
+
+    google_spreadsheets._service_accounts[(str(SERVICE_ACCOUNT_CREDENTIALS), tuple(SCOPES), 'sheets', 'v4')] = sa
+
+
+class FakeBot:
+
+    def __init__(self, latency=0.0):
+        """Stand-in of `aiogram.Bot` for the restriction calls.
+
+        :param latency: float  Seconds every call takes.
+        """
+        self.latency = latency
+        self.calls = Counter()
+
+    async def _call(self, method):
+        self.calls[method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    async def restrict_chat_member(self, chat_id, user_id, permissions, **kwargs):
+        await self._call('restrictChatMember')
+        return True
+
+    async def get_chat_member(self, chat_id, user_id, **kwargs):
+        await self._call('getChatMember')
+        return SimpleNamespace(status='restricted', can_send_messages=False)
+
+
+class FakeTelegramServer:
+
+    # Methods answered with a message, the others are answered with True
+    MESSAGE_METHODS = {'sendMessage', 'editMessageText', 'editMessageReplyMarkup', 'sendDocument'}
+
+    def __init__(self, latency=0.0):
+        """Local HTTP server answering the Bot API methods.
+
+        It runs in its own thread and event loop, so serving the requests
+        does not load the event loop of the bot being measured.
+
+        :param latency: float  Seconds every request takes.
+        """
+        self.latency = latency
+        self.calls = Counter()
+        self.url = None
+        self._loop = None
+        self._thread = None
+        self._runner = None
+
+    async def _handle(self, request):
+        method = request.match_info['method']
+        self.calls[method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if method not in self.MESSAGE_METHODS:
+            return web.json_response({'ok': True, 'result': True})
+
+        params = dict(await request.post())
+        chat_id = int(params.get('chat_id') or 0)
+        return web.json_response({'ok': True, 'result': {
+            'message_id': int(params.get('message_id') or 1),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private' if chat_id > 0 else 'supergroup'},
+            'text': params.get('text', ''),
+        }})
+
+    async def _start(self):
+        app = web.Application()
+        app.router.add_post('/bot{token}/{method}', self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', 0)
+        await site.start()
+        host, port = self._runner.addresses[0][:2]
+        self.url = 'http://{}:{}'.format(host, port)
+
+    def start(self):
+        """Start serving in a background thread, return the base URL of the server."""
+        started = threading.Event()
+
+        def serve():
+            self._loop = asyncio.new_event_loop()
+            self._loop.run_until_complete(self._start())
+            started.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=serve, name='fake-telegram', daemon=True)
+        self._thread.start()
+        started.wait()
+        return self.url
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
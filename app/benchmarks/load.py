@@ -0,0 +1,301 @@
+"""Load test of the update handling: synthetic group traffic through the Dispatcher.
+
+    python -m benchmarks.load --scenario messages --updates 20000 --rate 0
+    python -m benchmarks.load --scenario all --members 100000 --telegram-latency 0.05
+
+Updates are parsed and fed to the Dispatcher the way the webhook does it,
+every update in its own task. Telegram is a local HTTP server and Sheets an
+in-process fake, both with a configurable latency. The sheet poller and the
+registration flush run alongside like in production.
+
+Scenarios:
+    messages  bursts of group messages from known and new users
+    joins     join waves, every update adds `--wave` members
+    clicks    admins paging through the admin list and cancelling
+"""
+
+import argparse
+import asyncio
+import contextlib
+import itertools
+import os
+import random
+import tempfile
+import time
+from collections import defaultdict
+
+from aiogram import BaseMiddleware, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.types import CallbackQuery, Update
+
+from benchmarks.fakes import (
+    BENCH_CHAT_ID,
+    FakeSheetsService,
+    FakeTelegramServer,
+    install_offline_config,
+    install_service_account,
+    member_rows,
+    offline_service_account,
+)
+
+install_offline_config()
+service = FakeSheetsService([])
+sa = offline_service_account(service)
+install_service_account(sa)
+
+from src import restricted  # noqa: E402
+from src.leader import election  # noqa: E402
+from src.tgbot import handlers  # noqa: E402
+from src.tgbot.allowlist import Allowlist  # noqa: E402
+from src.tgbot.callbacks import (  # noqa: E402
+    AdminsPageCallback,
+    DeleteAdminAction,
+    DeleteAdminCallback,
+    MenuAction,
+    MenuCallback,
+)
+from src.tgbot.loader import bot  # noqa: E402
+from src.utils import POLL_MIN_INTERVAL  # noqa: E402
+
+SCENARIOS = ['messages', 'joins', 'clicks']
+ADMIN_ID = 42
+ADMIN_USERNAME = 'bench_admin'
+# Loop lag is sampled that often
+LAG_INTERVAL = 0.01
+
+
+class HandlerTimer(BaseMiddleware):
+    """Inner middleware recording the time spent in every handler."""
+
+    def __init__(self):
+        self.timings = defaultdict(list)
+
+    async def __call__(self, handler, event, data):
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            name = data['handler'].callback.__name__
+            router = data.get('callback_router')
+            if router is not None and isinstance(event, CallbackQuery):
+                name = router.route_name(event.data) or name
+            self.timings[name].append(time.perf_counter() - start)
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def user(user_id, username=None):
+    return {'id': user_id, 'is_bot': False, 'first_name': 'User {}'.format(user_id), 'username': username}
+
+
+def message_updates(count, members, users):
+    """Group messages from `users` senders, half of them are not in the sheet yet."""
+    known = [5_000_000_000 + i for i in range(min(members, users // 2))]
+    new = [8_000_000_000 + i for i in range(users - len(known))]
+    senders = known + new
+    for update_id in range(count):
+        sender = random.choice(senders)
+        yield {
+            'update_id': update_id,
+            'message': {
+                'message_id': update_id + 1,
+                'date': int(time.time()),
+                'chat': {'id': BENCH_CHAT_ID, 'type': 'supergroup', 'title': 'Bench'},
+                'from': user(sender, 'user{}'.format(sender)),
+                'text': 'Message {}'.format(update_id),
+            },
+        }
+
+
+def join_updates(count, wave):
+    """Join waves, every update adds `wave` new members."""
+    user_ids = itertools.count(7_000_000_000)
+    for update_id in range(count):
+        joined = [user(next(user_ids)) for _ in range(wave)]
+        yield {
+            'update_id': update_id,
+            'message': {
+                'message_id': update_id + 1,
+                'date': int(time.time()),
+                'chat': {'id': BENCH_CHAT_ID, 'type': 'supergroup', 'title': 'Bench'},
+                'from': joined[0],
+                'new_chat_members': joined,
+            },
+        }
+
+
+def click_updates(count, admins):
+    """Admin panel clicks: open the admin list, page through it, ask to delete and cancel."""
+    pages = max(1, (admins + 4) // 5)
+    for update_id in range(count):
+        page = random.randrange(pages) * 5
+        data = random.choice([
+            MenuCallback(action=MenuAction.DELETE_ADMIN),
+            AdminsPageCallback(start=page),
+            DeleteAdminCallback(action=DeleteAdminAction.CONFIRM, username='admin{}'.format(random.randrange(admins))),
+            DeleteAdminCallback(action=DeleteAdminAction.NO, username='admin{}'.format(random.randrange(admins))),
+            MenuCallback(action=MenuAction.CANCEL),
+        ]).pack()
+        yield {
+            'update_id': update_id,
+            'callback_query': {
+                'id': str(update_id),
+                'from': user(ADMIN_ID, ADMIN_USERNAME),
+                'chat_instance': '1',
+                'data': data,
+                'message': {
+                    'message_id': 1,
+                    'date': int(time.time()),
+                    'chat': {'id': ADMIN_ID, 'type': 'private'},
+                    'text': 'Admin panel',
+                },
+            },
+        }
+
+
+async def watch_loop_lag(samples):
+    """Record how late the loop wakes up a task sleeping for LAG_INTERVAL."""
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(LAG_INTERVAL)
+        samples.append(loop.time() - start - LAG_INTERVAL)
+
+
+async def poll_sheet(reconciler):
+    """The sheet poller at its fastest interval, as right after a change."""
+    while True:
+        await reconciler.check(bot)
+        await asyncio.sleep(POLL_MIN_INTERVAL)
+
+
+async def feed(dp, updates, rate):
+    """Feed the raw updates, `rate` per second or as fast as possible if 0.
+
+    :return: tuple[list[float], float]  Latency of every update from its arrival
+        to the end of its handling and the total time.
+    """
+    latencies = []
+    tasks = set()
+
+    async def process(raw, arrived):
+        update = Update.model_validate(raw, context={'bot': bot})
+        await dp.feed_update(bot, update)
+        latencies.append(time.perf_counter() - arrived)
+
+    start = time.perf_counter()
+    for number, raw in enumerate(updates):
+        if rate:
+            delay = start + number / rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        elif number % 100 == 0:
+            # Updates arrive in batches of up to 100 like in long polling
+            await asyncio.sleep(0)
+        task = asyncio.create_task(process(raw, time.perf_counter()))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    while tasks:
+        await asyncio.gather(*tasks, return_exceptions=True)
+    return latencies, time.perf_counter() - start
+
+
+def make_updates(name, count, args):
+    if name == 'messages':
+        return message_updates(count, args.members, args.users)
+    if name == 'joins':
+        return join_updates(max(1, count // args.wave), args.wave)
+    return click_updates(count, args.admins)
+
+
+async def run_scenario(name, dp, timer, telegram, args):
+    # The models and the handlers are set up lazily on the first updates
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        await feed(dp, make_updates(name, args.warmup, args), 0)
+    updates = make_updates(name, args.updates, args)
+
+    timer.timings.clear()
+    telegram.calls.clear()
+    service.reset_stats()
+    lag = []
+    lag_task = asyncio.create_task(watch_loop_lag(lag))
+    # Output of the bot is dropped, its cost is still measured
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        latencies, elapsed = await feed(dp, updates, args.rate)
+    lag_task.cancel()
+
+    print('\n{}: {} updates in {:.2f} s, {:.0f} updates/s'.format(
+        name, len(latencies), elapsed, len(latencies) / elapsed if elapsed else 0))
+    print('  update latency ms    p50 {:8.2f}  p99 {:8.2f}  max {:8.2f}'.format(
+        percentile(latencies, 0.5) * 1000, percentile(latencies, 0.99) * 1000, max(latencies, default=0) * 1000))
+    print('  loop lag ms          p50 {:8.2f}  p99 {:8.2f}  max {:8.2f}'.format(
+        percentile(lag, 0.5) * 1000, percentile(lag, 0.99) * 1000, max(lag, default=0) * 1000))
+    for handler, timings in sorted(timer.timings.items()):
+        print('  {:<28} n {:7}  p50 {:8.2f}  p99 {:8.2f} ms'.format(
+            handler, len(timings), percentile(timings, 0.5) * 1000, percentile(timings, 0.99) * 1000))
+    print('  telegram calls: {}'.format(dict(telegram.calls) or '-'))
+    print('  sheets calls:   {}'.format(dict(service.calls) or '-'))
+
+
+async def main(args):
+    telegram = FakeTelegramServer(args.telegram_latency)
+    url = telegram.start()
+    bot.session = AiohttpSession(api=TelegramAPIServer.from_base(url))
+
+    service.rows = member_rows(args.members)
+    service.latency = args.sheets_latency
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, 'allowed_usernames')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join([ADMIN_USERNAME] + ['admin{}'.format(i) for i in range(args.admins)]))
+        handlers.allowlist = Allowlist(path)
+
+        dp = Dispatcher()
+        handlers.register_handlers(dp)
+        timer = HandlerTimer()
+        dp.message.middleware(timer)
+        dp.callback_query.middleware(timer)
+
+        queue = handlers.registration_queues[BENCH_CHAT_ID]
+        await queue.load_members()
+        # The only process, it is elected right away and saves the new members itself
+        background = [asyncio.create_task(election.run([])), asyncio.create_task(queue.run())]
+        if not args.no_poller:
+            background.append(asyncio.create_task(poll_sheet(restricted.reconcilers[BENCH_CHAT_ID])))
+
+        try:
+            for name in SCENARIOS if args.scenario == 'all' else [args.scenario]:
+                await run_scenario(name, dp, timer, telegram, args)
+        finally:
+            for task in background:
+                task.cancel()
+            await bot.session.close()
+            telegram.stop()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenario', choices=SCENARIOS + ['all'], default='all')
+    parser.add_argument('--updates', type=int, default=10000, help='Updates per scenario')
+    parser.add_argument('--warmup', type=int, default=200, help='Not measured updates before every scenario')
+    parser.add_argument('--rate', type=float, default=0, help='Updates per second, 0 is as fast as possible')
+    parser.add_argument('--members', type=int, default=10000, help='Members in the sheet')
+    parser.add_argument('--users', type=int, default=5000, help='Distinct senders of the messages')
+    parser.add_argument('--wave', type=int, default=200, help='Members joining in one update')
+    parser.add_argument('--admins', type=int, default=300, help='Usernames in the admin list')
+    parser.add_argument('--telegram-latency', type=float, default=0.0, help='Seconds per Telegram request')
+    parser.add_argument('--sheets-latency', type=float, default=0.0, help='Seconds per Sheets request')
+    parser.add_argument('--no-poller', action='store_true', help='Do not poll the sheet during the load')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,264 @@
+"""Latency, allocations and API calls of the Sheets operations as the sheet grows.
+
+    python -m benchmarks.sheets --members 1000 10000 100000 500000 --json results.json
+    python -m benchmarks.sheets --baseline results.json
+
+With `--baseline` the results are compared with a saved run and the exit
+code is 1 if an operation got slower, allocates more or makes more API calls.
+"""
+
+import argparse
+import asyncio
+import inspect
+import json
+import logging
+import statistics
+import sys
+import time
+import tracemalloc
+
+from benchmarks.fakes import (
+    BENCH_CHAT_ID,
+    FakeBot,
+    FakeSheetsService,
+    install_offline_config,
+    install_service_account,
+    member_rows,
+    offline_service_account,
+)
+
+install_offline_config()
+sa = offline_service_account(FakeSheetsService([]))
+install_service_account(sa)
+
+from src import restricted  # noqa: E402
+from src.groups import Group  # noqa: E402
+from src.members import FIRST_ROW, get_member_index  # noqa: E402
+from src.utils.rate_limit import TokenBucket  # noqa: E402
+
+DEFAULT_MEMBERS = [1000, 10000, 100000, 500000]
+# Slower runs shorter than this are taken as noise
+NOISE_MS = 1.0
+
+
+class Case:
+
+    def __init__(self, name, run, setup=None):
+        """One measured operation.
+
+        :param name: str  Operation name in the report.
+        :param run: callable  Measured call, a function or a coroutine function.
+        :param setup: callable  Not measured call preparing every run.
+        """
+        self.name = name
+        self.run = run
+        self.setup = setup
+
+
+async def call(func):
+    if func is None:
+        return
+    result = func()
+    if inspect.isawaitable(result):
+        await result
+
+
+def plain_member(count, start):
+    """Return the number of a member which is neither restricted nor has a deposit."""
+    number = start
+    while number % 100 == 0 or number % 250 == 0:
+        number += 1
+    return number % count
+
+
+def make_cases(service, bot, count):
+    spreadsheet_id = 'bench-{}'.format(count)
+    sync = sa.sync
+    index = get_member_index(spreadsheet_id)
+    state = {'new_id': 9_000_000_000, 'deposit': 0}
+
+    member = plain_member(count, count // 2)
+    username = 'member{}'.format(member)
+    batch = [plain_member(count, count // 3 + i) for i in range(min(100, count // 2))]
+    batch_usernames = ['member{}'.format(number) for number in batch]
+
+    def unrestrict(numbers):
+        for number in numbers:
+            service.rows[number + FIRST_ROW - 1][5] = 0
+            record = index.get(5_000_000_000 + number)
+            if record is not None:
+                record.restricted = 0
+
+    def save_new():
+        state['new_id'] += 1
+        sync.save_user_to_sheets(spreadsheet_id, {'id': state['new_id'], 'name': 'New', 'username': 'new'})
+
+    group = Group(BENCH_CHAT_ID, spreadsheet_id)
+
+    def new_reconciler(checksum_cell=''):
+        restricted.store.update(BENCH_CHAT_ID, unrestricted=restricted.store.load(BENCH_CHAT_ID))
+        reconciler = restricted.GroupReconciler(group, checksum_cell)
+        # Telegram rate limits are not what is measured
+        reconciler.executor.limiter = TokenBucket(10 ** 9)
+        restricted.reconcilers[BENCH_CHAT_ID] = reconciler
+        return reconciler
+
+    async def checked_reconciler():
+        reconciler = restricted.reconcilers.get(BENCH_CHAT_ID)
+        if reconciler is None or reconciler.group is not group or reconciler.checksum_cell:
+            await new_reconciler().check(bot)
+
+    async def checksum_reconciler():
+        # The checksum formula of the README in H1, it does not change while idle
+        service.rows[0][6:8] = ['', 1]
+        reconciler = restricted.reconcilers.get(BENCH_CHAT_ID)
+        if reconciler is None or reconciler.group is not group or reconciler.checksum_cell != 'H1':
+            await new_reconciler('H1').check(bot)
+
+    async def edit_deposit():
+        await checked_reconciler()
+        state['deposit'] = 0 if state['deposit'] else 100
+        service.rows[member + FIRST_ROW - 1][4] = state['deposit']
+        service.rows[member + FIRST_ROW - 1][5] = 0
+
+    def check():
+        return restricted.check_restricted_users(bot, BENCH_CHAT_ID)
+
+    return [
+        Case('load_member_index', lambda: sync.load_member_index(spreadsheet_id)),
+        Case('refresh_member_index', lambda: sync.refresh_member_index(spreadsheet_id)),
+        Case('get_restricted_user_ids', lambda: sync.get_restricted_user_ids(spreadsheet_id)),
+        Case('save_user_to_sheets[known]',
+             lambda: sync.save_user_to_sheets(spreadsheet_id, {'id': 5_000_000_000 + member, 'name': 'Known'})),
+        Case('save_user_to_sheets[new]', save_new),
+        Case('restrict_user', lambda: sync.restrict_user(spreadsheet_id, username), lambda: unrestrict([member])),
+        Case('set_restricted[{}]'.format(len(batch)),
+             lambda: sync.set_restricted(spreadsheet_id, batch_usernames), lambda: unrestrict(batch)),
+        Case('check_restricted_users[first]', check, new_reconciler),
+        Case('check_restricted_users[idle]', check, checked_reconciler),
+        Case('check_restricted_users[edit]', check, edit_deposit),
+        Case('check_restricted_users[checksum]', check, checksum_reconciler),
+    ]
+
+
+async def measure(case, service, bot, repeat):
+    """Run the case `repeat` times for the latency and once more under tracemalloc."""
+    timings = []
+    api_timings = []
+    for _ in range(repeat):
+        await call(case.setup)
+        service.reset_stats()
+        bot.calls.clear()
+        start = time.perf_counter()
+        await call(case.run)
+        timings.append(time.perf_counter() - start)
+        api_timings.append(service.api_time)
+
+    await call(case.setup)
+    service.reset_stats()
+    service.record_payloads = True
+    bot.calls.clear()
+    tracemalloc.start()
+    try:
+        await call(case.run)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+        service.record_payloads = False
+    sent, received = service.payload_bytes()
+    calls = dict(service.calls)
+    service.reset_stats()
+
+    return {
+        'median_ms': statistics.median(timings) * 1000,
+        'min_ms': min(timings) * 1000,
+        'api_ms': statistics.median(api_timings) * 1000,
+        'peak_kib': peak / 1024,
+        'sheets_calls': calls,
+        'sent_kib': sent / 1024,
+        'received_kib': received / 1024,
+        'bot_calls': sum(bot.calls.values()),
+    }
+
+
+async def run(members, repeat, only=None):
+    results = {}
+    bot = FakeBot()
+    for count in members:
+        service = FakeSheetsService(member_rows(count))
+        sa.sync.service = service
+        results[str(count)] = count_results = {}
+        print('\n{} members'.format(count))
+        print('{:<32} {:>10} {:>10} {:>10} {:>12} {:>10} {:>10} {:>5}  {}'.format(
+            'operation', 'median ms', 'min ms', 'fake ms', 'peak KiB', 'sent KiB', 'recv KiB', 'bot', 'sheets calls'))
+
+        for case in make_cases(service, bot, count):
+            if only and not any(name in case.name for name in only):
+                continue
+            # The info records of every check and restriction are not written, only the cost of the calls is measured
+            logging.disable(logging.INFO)
+            try:
+                result = await measure(case, service, bot, repeat)
+            finally:
+                logging.disable(logging.NOTSET)
+            count_results[case.name] = result
+            print('{:<32} {:>10.2f} {:>10.2f} {:>10.2f} {:>12.1f} {:>10.1f} {:>10.1f} {:>5}  {}'.format(
+                case.name, result['median_ms'], result['min_ms'], result['api_ms'], result['peak_kib'],
+                result['sent_kib'], result['received_kib'], result['bot_calls'],
+                ' '.join('{}={}'.format(method, number) for method, number in sorted(result['sheets_calls'].items()))
+            ))
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Return the regressions of `results` against `baseline`."""
+    regressions = []
+    for count, cases in results.items():
+        for name, result in cases.items():
+            base = baseline.get(count, {}).get(name)
+            if base is None:
+                continue
+            label = '{} members, {}'.format(count, name)
+            if result['median_ms'] > base['median_ms'] * tolerance and \
+                    result['median_ms'] - base['median_ms'] > NOISE_MS:
+                regressions.append('{}: {:.2f} ms, was {:.2f} ms'.format(label, result['median_ms'], base['median_ms']))
+            if result['peak_kib'] > base['peak_kib'] * tolerance and result['peak_kib'] - base['peak_kib'] > 64:
+                regressions.append('{}: peak {:.0f} KiB, was {:.0f} KiB'.format(
+                    label, result['peak_kib'], base['peak_kib']))
+            calls, base_calls = sum(result['sheets_calls'].values()), sum(base['sheets_calls'].values())
+            if calls > base_calls:
+                regressions.append('{}: {} Sheets calls, was {}'.format(label, calls, base_calls))
+            if result['bot_calls'] > base['bot_calls']:
+                regressions.append('{}: {} bot calls, was {}'.format(label, result['bot_calls'], base['bot_calls']))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--members', type=int, nargs='+', default=DEFAULT_MEMBERS, help='Sheet sizes')
+    parser.add_argument('--repeat', type=int, default=3, help='Measured runs of every operation')
+    parser.add_argument('--only', nargs='+', help='Run only the operations containing these names')
+    parser.add_argument('--json', help='Save the results to the file')
+    parser.add_argument('--baseline', help='Compare the results with the saved ones')
+    parser.add_argument('--tolerance', type=float, default=1.25, help='Allowed slowdown against the baseline')
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.members, args.repeat, args.only))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print('\nRegressions:')
+            for regression in regressions:
+                print('  ' + regression)
+            sys.exit(1)
+        print('\nNo regressions')
+
+
+if __name__ == '__main__':
+    main()
@@ -3,3 +3,41 @@ BOT_TOKEN = ''
 GROUP_CHAT_ID = ''
 
 SPREADSHEET_ID = ''
+
+# Updates are received by long polling unless WEBHOOK_URL is set, example: 'https://bot.example.com'
+WEBHOOK_URL = ''
+WEBHOOK_PATH = '/webhook'
+# Telegram sends it in the X-Telegram-Bot-Api-Secret-Token header, requests without it are rejected
+WEBHOOK_SECRET = ''
+WEBHOOK_HOST = '0.0.0.0'
+WEBHOOK_PORT = 8080
+# Max number of the simultaneous update requests from Telegram (1-100)
+WEBHOOK_MAX_CONNECTIONS = 40
+
+# One bot can serve many groups, each with its own spreadsheet: {group_chat_id: spreadsheet_id}
+# GROUP_CHAT_ID with SPREADSHEET_ID is served as well, it is the default group
+# of the admin commands sent in the private chat
+GROUPS = {}
+
+# Endpoint the sheet calls on edit (e.g. Apps Script onEdit trigger) to apply restrictions right away.
+# Disabled when SYNC_PORT is 0, the sheet is polled then as often as POLL_MIN_INTERVAL
+SYNC_HOST = '127.0.0.1'
+SYNC_PORT = 0
+SYNC_PATH = '/sync'
+# Sent by the caller in the X-Sync-Secret header, requests without it are rejected
+SYNC_SECRET = ''
+
+# Cell of the members sheet with the checksum formula of the README, example: 'H1'. The sheet checks
+# read this one cell and read the id, deposit and restricted columns only when it has changed.
+# When empty the columns are read on every check
+SHEET_CHECKSUM_CELL = ''
+
+# Prometheus metrics are served at http://METRICS_HOST:METRICS_PORT/metrics, disabled when METRICS_PORT is 0
+METRICS_HOST = '127.0.0.1'
+METRICS_PORT = 0
+
+# Several processes can serve the bot on one host, one of them is elected to run the sheet checks,
+# to save the new members and to serve the sync endpoint. Role of the process, `--role` overrides it:
+# 'all' handles the updates and runs the jobs when elected, 'bot' only handles the updates,
+# 'jobs' only runs the jobs when elected. Updates are spread across the processes in webhook mode only
+WORKER_ROLE = 'all'
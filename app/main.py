@@ -1,35 +1,103 @@
+import argparse
+import functools
+import logging
 import os
+import random
 
 import asyncio
 
 os.chdir(os.path.dirname(os.path.abspath(__file__)))
 
+from src.utils import logger_init, LOG_DIR
+
+if __name__ == '__main__':
+    # Before the other modules are imported, they log while being set up
+    logger_init(LOG_DIR)
+
 from src.tgbot.bot import run_bot
-from src.restricted import check_restricted_users
+from src.restricted import reconcilers
 from src.tgbot.loader import bot
+from src.tgbot.handlers import registration_queues
+from src.google_spreadsheets import get_service_account
+from src.utils import (
+    RESTRICT_AUDIT_ON_STARTUP,
+    POLL_MIN_INTERVAL,
+    POLL_MAX_INTERVAL,
+    SYNC_POLL_MIN_INTERVAL,
+    WORKER_ROLES,
+)
+from src.sync_server import run_sync_server
+from src.metrics import Histogram, run_metrics_server
+from src.profiling import LoopWatchdog
+from src.leader import election
+from config import SYNC_PORT, METRICS_PORT, WORKER_ROLE
+from src.utils.polling import AdaptiveInterval
 
+TICK_DURATION = Histogram('periodic_check_tick_duration_seconds', 'Duration of a periodic check tick.', ['chat_id'])
 
-async def periodic_check():
+
+async def periodic_check(reconciler):
     """
-    Check restricted users every 5 seconds
+    Check restricted users of the group, often after the sheet changes and rarely while it is idle
     """
+    # Start from the restrictions applied by the previous leader
+    reconciler.reload()
+
+    # Spread the checks of the groups in time
+    await asyncio.sleep(random.uniform(0, POLL_MIN_INTERVAL))
+
+    if RESTRICT_AUDIT_ON_STARTUP:
+        await reconciler.audit(bot)
+
+    if SYNC_PORT:
+        # Edits are pushed to the sync endpoint, polling only catches the missed ones
+        interval = AdaptiveInterval(SYNC_POLL_MIN_INTERVAL, max(SYNC_POLL_MIN_INTERVAL, POLL_MAX_INTERVAL))
+    else:
+        interval = AdaptiveInterval()
+    loop = asyncio.get_running_loop()
+    tick_duration = TICK_DURATION.labels(str(reconciler.group.chat_id))
     while True:
-        await check_restricted_users(bot)
-        await asyncio.sleep(5)
+        start = loop.time()
+        changed = await reconciler.check(bot)
+        tick_duration.observe(loop.time() - start)
+        await asyncio.sleep(interval.next(changed))
 
 
-async def main():
+async def main(role=WORKER_ROLE, metrics_port=METRICS_PORT):
     """
-    Run tgbot and users check in parallels
+    Run tgbot, new members saving of every group, token refresh, the metrics endpoint
+    and the event loop watchdog in parallels. Users check of every group and the sync endpoint
+    run in the one process elected among the ones on the host.
+
+    :param role: str  One of WORKER_ROLES.
+    :param metrics_port: int  Port of the metrics endpoint, disabled if 0.
     """
+    jobs = [functools.partial(periodic_check, reconciler) for reconciler in reconcilers.values()]
+    if SYNC_PORT:
+        jobs.append(functools.partial(run_sync_server, bot))
+
     await asyncio.gather(
-        run_bot(),
-        periodic_check()
+        *([run_bot(metrics=bool(metrics_port))] if role != 'jobs' else []),
+        *([election.run(jobs)] if role != 'bot' else []),
+        LoopWatchdog().run(),
+        *([run_metrics_server(port=metrics_port)] if metrics_port else []),
+        # New members are saved by the leader, the other processes hand them off
+        *(registration_queue.run() for registration_queue in registration_queues.values()),
+        get_service_account().keep_token_fresh()
     )
 
 
+def parse_args():
+    parser = argparse.ArgumentParser(description='Telegram bot restricting the group members listed in the sheet')
+    parser.add_argument('--role', choices=WORKER_ROLES, default=WORKER_ROLE, help='Overrides WORKER_ROLE')
+    parser.add_argument('--metrics-port', type=int, default=METRICS_PORT,
+                        help='Overrides METRICS_PORT, every process needs its own port')
+    return parser.parse_args()
+
+
 if __name__ == '__main__':
+    args = parse_args()
     try:
-        asyncio.run(main())
+        asyncio.run(main(args.role, args.metrics_port))
     except Exception as ex:
-        print(ex)
+        logging.getLogger(__name__).exception(ex)
@@ -1,17 +1,97 @@
+import asyncio
+import contextlib
+import functools
 import json
 import logging
-from datetime import datetime
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 
+import httplib2
 from google.oauth2 import service_account
+from google_auth_httplib2 import AuthorizedHttp, Request
 from googleapiclient.discovery import build
 
-import pandas as pd
-
-from src.utils import LOG_LEVEL
+from src.metrics import Counter, Histogram
+from src.members import (
+    COLUMNS,
+    FIRST_ROW,
+    MemberIndex,
+    MemberRecord,
+    column_letter,
+    get_member_index,
+    is_restricted,
+    to_float,
+)
+from src.sheets_guard import SheetsGuard, StaleReads
+from src.utils import (
+    LOG_LEVEL,
+    SHEETS_MAX_WORKERS,
+    SERVICE_ACCOUNT_CREDENTIALS,
+    SCOPES,
+    TOKEN_REFRESH_MARGIN,
+)
 
 logger = logging.getLogger(__name__)
 logger.setLevel(LOG_LEVEL)
 
+SHEETS_REQUESTS = Counter('sheets_requests_total', 'Sheets API requests.', ['kind', 'status'])
+SHEETS_REQUEST_DURATION = Histogram('sheets_request_duration_seconds', 'Sheets API request duration.', ['kind'])
+SHEETS_SENT_BYTES = Counter('sheets_sent_bytes_total', 'Size of the Sheets API request bodies.', ['kind'])
+SHEETS_RECEIVED_BYTES = Counter('sheets_received_bytes_total', 'Size of the Sheets API responses.', ['kind'])
+
+
+SHEETS_API_URI = 'https://sheets.googleapis.com/'
+
+
+class MeteredHttp:
+    """Plain httplib2 connection counting the Sheets requests and their size.
+
+    It is wrapped by `AuthorizedHttp`, so every request sent on the wire is
+    counted, the retries of the guard and the ones after a token refresh too.
+    GET requests are reads, the other ones are writes. With a `guard` every
+    Sheets request goes through it, the token requests are sent as they are.
+    """
+
+    def __init__(self, http, guard=None):
+        """
+        :param http: httplib2.Http  Connection sending the requests.
+        :param guard: SheetsGuard  Quota guard of the Sheets requests.
+        """
+        self.http = http
+        self.guard = guard
+
+    def __getattr__(self, name):
+        # timeout, connections and the rest of httplib2.Http
+        if name == 'http':
+            raise AttributeError(name)
+        return getattr(self.http, name)
+
+    def request(self, uri, method='GET', body=None, *args, **kwargs):
+        if not uri.startswith(SHEETS_API_URI):
+            return self.http.request(uri, method, body, *args, **kwargs)
+        if self.guard is None:
+            return self._metered_request(uri, method, body, *args, **kwargs)
+        return self.guard.request(lambda: self._metered_request(uri, method, body, *args, **kwargs), uri, method)
+
+    def _metered_request(self, uri, method='GET', body=None, *args, **kwargs):
+        kind = 'read' if method == 'GET' else 'write'
+        start = time.perf_counter()
+        try:
+            response, content = self.http.request(uri, method, body, *args, **kwargs)
+        except Exception:
+            SHEETS_REQUESTS.labels(kind, 'error').inc()
+            raise
+        finally:
+            SHEETS_REQUEST_DURATION.labels(kind).observe(time.perf_counter() - start)
+
+        SHEETS_REQUESTS.labels(kind, str(response.status)).inc()
+        SHEETS_SENT_BYTES.labels(kind).inc(len(body) if body else 0)
+        SHEETS_RECEIVED_BYTES.labels(kind).inc(len(content) if content else 0)
+        return response, content
+
 
 class ServiceAccount:
 
@@ -25,45 +105,137 @@ class ServiceAccount:
         """
 
         # Load service account credentials
-        self.credentials = service_account.Credentials.from_service_account_file(credentials)
+        self.credentials = service_account.Credentials.from_service_account_file(credentials, scopes=scopes)
         self.scopes = scopes
 
-        # Build the service
-        self.service = build(service_name, version, credentials=self.credentials)
+        # Build the service from the discovery document bundled with the library
+        self.service = build(
+            service_name,
+            version,
+            credentials=self.credentials,
+            static_discovery=True,
+            cache_discovery=False
+        )
 
-    def read_spreadsheet(self, spreadsheet_id, range_name, header=True):
-        """Read spreadsheet and return dataframe.
+        # httplib2 connections are not thread-safe, every thread keeps its own
+        # keep-alive connection, so the pool is as large as the number of workers
+        self._local = threading.local()
+        # Quota budget, retries and degraded mode shared by the connections
+        self.guard = SheetsGuard()
+
+    def _http(self):
+        """Return the authorized http connection of the current thread."""
+        http = getattr(self._local, 'http', None)
+        if http is None:
+            # The guard is inside the authorization, so the request repeated
+            # after a token refresh is a new request for it
+            http = self._local.http = AuthorizedHttp(
+                self.credentials, http=MeteredHttp(httplib2.Http(), guard=self.guard))
+        return http
+
+    def stale_reads(self):
+        """Let the reads of the block be served from the last good responses, see `SheetsGuard.stale_reads`."""
+        if self.guard is None:
+            return contextlib.nullcontext(StaleReads())
+        return self.guard.stale_reads()
+
+    def refresh_credentials(self, margin=TOKEN_REFRESH_MARGIN):
+        """Refresh the access token if it expires within `margin` seconds.
+
+        :return: datetime  Expiry of the access token (UTC, naive).
+        """
+        expiry = self.credentials.expiry
+        if not self.credentials.token or expiry is None or \
+                expiry - datetime.utcnow() < timedelta(seconds=margin):
+            self.credentials.refresh(Request(self._http().http))
+            logger.info('Access token refreshed, expires at {}.'.format(self.credentials.expiry))
+        return self.credentials.expiry
+
+    def read_values(self, spreadsheet_id, range_name):
+        """Read spreadsheet and return the raw values.
 
         :param spreadsheet_id: str  Spreadsheet ID. Can be retrieved from the URL.
         :param range_name: str  Range of the data. Example: 'A:B', 'Sheet1!A1:C60'
-        :param header: bool  Whether to set header from the first row.
-        :return: pd.DataFrame  Spreadsheet as a dataframe.
+        :return: list[list]  Rows of the range, empty trailing cells are omitted.
         """
 
         # Call the Sheets API to get the specified range of values
-        result = self.service.spreadsheets().values().get(spreadsheetId=spreadsheet_id, range=range_name).execute()
+        result = self.service.spreadsheets().values().get(
+            spreadsheetId=spreadsheet_id, range=range_name
+        ).execute(http=self._http())
 
         # Get the values from the response
-        values = result.get('values', [])
+        return result.get('values', [])
+
+    def read_columns(self, spreadsheet_id, columns, value_render_option='UNFORMATTED_VALUE'):
+        """Read only the given columns of the members sheet in one request.
+
+        :param spreadsheet_id: str  Spreadsheet ID. Can be retrieved from the URL.
+        :param columns: list[str]  Column names. Example: ['id', 'deposit']
+        :param value_render_option: str  'UNFORMATTED_VALUE' returns numbers as numbers.
+        :return: dict[str, list]  Values of every column including the header,
+            empty trailing cells are omitted.
+        """
+        result = self.service.spreadsheets().values().batchGet(
+            spreadsheetId=spreadsheet_id,
+            ranges=['{0}:{0}'.format(column_letter(column)) for column in columns],
+            majorDimension='COLUMNS',
+            valueRenderOption=value_render_option
+        ).execute(http=self._http())
+
+        value_ranges = result.get('valueRanges', [])
+        return {
+            column: (value_range.get('values') or [[]])[0]
+            for column, value_range in zip(columns, value_ranges)
+        }
+
+    def read_members(self, spreadsheet_id):
+        """Read the members sheet.
+
+        :param spreadsheet_id: str  Spreadsheet ID. Can be retrieved from the URL.
+        :return: list[MemberRecord]  Members in the sheet order.
+        """
+        values = self.read_values(spreadsheet_id, 'A:F')
+        return [MemberRecord.from_values(row, row_values)
+                for row, row_values in enumerate(values[1:], FIRST_ROW) if row_values]
+
+    def read_spreadsheet(self, spreadsheet_id, range_name, header=True):
+        """Read spreadsheet and return dataframe, meant for the bulk export.
+
+        :param spreadsheet_id: str  Spreadsheet ID. Can be retrieved from the URL.
+        :param range_name: str  Range of the data. Example: 'A:B', 'Sheet1!A1:C60'
+        :param header: bool  Whether to set header from the first row.
+        :return: pd.DataFrame  Spreadsheet as a dataframe.
+        """
+        # pandas is heavy and optional, so it is imported only here
+        import pandas as pd
+
+        values = self.read_values(spreadsheet_id, range_name)
 
         if not header:
             return pd.DataFrame(values)
         else:
             return pd.DataFrame(values[1:], columns=values[0])
 
-    def write_spreadsheet(self, spreadsheet_id, df: pd.DataFrame, header=True):
-        """Write the data to the spreadsheet
+    def write_spreadsheet(self, spreadsheet_id, data, header=True):
+        """Overwrite the spreadsheet starting from A1, meant for the bulk import.
+        Use `append_rows` and `update_cells` to change a few rows.
 
         :param spreadsheet_id: str  Spreadsheet ID. Can be retrieved from the URL.
-        :param df: pd.DataFrame  Data to be written to the spreadsheet.
+        :param data: list[MemberRecord] | list[list] | pd.DataFrame  Data to be written to the spreadsheet.
         :param header: bool  Whether to write header or not.
         :return:
         """
         # Prepare data to write to the spreadsheet
-        values = json.loads(df.to_json(orient='values'))
+        if hasattr(data, 'to_json'):
+            values = json.loads(data.to_json(orient='values'))
+            columns = data.columns.values.tolist()
+        else:
+            values = [row.to_values() if isinstance(row, MemberRecord) else list(row) for row in data]
+            columns = list(COLUMNS)
 
         if header:
-            values.insert(0, df.columns.values.tolist())
+            values.insert(0, columns)
 
         # Write data to the spreadsheet
         body = {
@@ -76,10 +248,116 @@ class ServiceAccount:
             range=range_,
             valueInputOption='RAW',
             body=body
-        ).execute()
+        ).execute(http=self._http())
         logger.info('Data written to spreadsheet "{}".'.format(spreadsheet_id))
 
-    def save_user_to_sheets(self, spreadsheet_id: int, users):
+    def append_rows(self, spreadsheet_id, rows, range_name='A:F'):
+        """Append rows after the last filled row of the range in one request.
+
+        :param spreadsheet_id: str  Spreadsheet ID. Can be retrieved from the URL.
+        :param rows: list[list]  Rows to be appended.
+        :param range_name: str  Range of the table to append to.
+        :return: int | None  Row number of the first appended row.
+        """
+        if not rows:
+            return None
+
+        result = self.service.spreadsheets().values().append(
+            spreadsheetId=spreadsheet_id,
+            range=range_name,
+            valueInputOption='RAW',
+            insertDataOption='INSERT_ROWS',
+            body={'values': rows}
+        ).execute(http=self._http())
+        logger.info('{} rows appended to spreadsheet "{}".'.format(len(rows), spreadsheet_id))
+
+        # Example: 'Sheet1!A10:F12'
+        match = re.search(r'![A-Z]+(\d+)', result.get('updates', {}).get('updatedRange', ''))
+        return int(match.group(1)) if match else None
+
+    def batch_update(self, spreadsheet_id, data):
+        """Write several ranges of the spreadsheet in one request.
+
+        :param spreadsheet_id: str  Spreadsheet ID. Can be retrieved from the URL.
+        :param data: dict[str, list[list]]  Values of every range. Example: {'F2': [[1]], 'F7': [[1]]}
+        :return:
+        """
+        if not data:
+            return
+
+        body = {
+            'valueInputOption': 'RAW',
+            'data': [{'range': range_name, 'values': values} for range_name, values in data.items()]
+        }
+        self.service.spreadsheets().values().batchUpdate(
+            spreadsheetId=spreadsheet_id,
+            body=body
+        ).execute(http=self._http())
+        logger.info('{} ranges updated in spreadsheet "{}".'.format(len(data), spreadsheet_id))
+
+    def update_cells(self, spreadsheet_id, row, column, value):
+        """Write one cell.
+
+        :param spreadsheet_id: str  Spreadsheet ID. Can be retrieved from the URL.
+        :param row: int  Sheet row number.
+        :param column: str | int  Column name from the header or zero-based column number.
+        :param value: Value of the cell.
+        :return:
+        """
+        self.service.spreadsheets().values().update(
+            spreadsheetId=spreadsheet_id,
+            range='{}{}'.format(column_letter(column), row),
+            valueInputOption='RAW',
+            body={'values': [[value]]}
+        ).execute(http=self._http())
+
+    def batch_update_cells(self, spreadsheet_id, cells):
+        """Write many single cells in one request.
+
+        :param spreadsheet_id: str  Spreadsheet ID. Can be retrieved from the URL.
+        :param cells: list[tuple[int, str | int, Any]]  (row, column, value) of every cell.
+        :return:
+        """
+        self.batch_update(spreadsheet_id, {
+            '{}{}'.format(column_letter(column), row): [[value]] for row, column, value in cells
+        })
+
+    def row_of(self, spreadsheet_id, user_id):
+        """Return the sheet row of the user or None if the user is not saved."""
+        record = self._loaded_member_index(spreadsheet_id).get(user_id)
+        return record.row if record is not None else None
+
+    @staticmethod
+    def member_index(spreadsheet_id) -> MemberIndex:
+        """Return the in-memory index of the spreadsheet members."""
+        return get_member_index(spreadsheet_id)
+
+    def load_member_index(self, spreadsheet_id):
+        """Load all the members of the spreadsheet to the index."""
+        values = self.read_values(spreadsheet_id, 'A:F')
+        index = self.member_index(spreadsheet_id)
+        index.load(values[1:])
+        logger.info('{} members loaded from spreadsheet "{}".'.format(len(index), spreadsheet_id))
+        return index
+
+    def refresh_member_index(self, spreadsheet_id):
+        """Add the rows appended to the spreadsheet since the last refresh to the index."""
+        index = self.member_index(spreadsheet_id)
+        if not index.loaded:
+            return self.load_member_index(spreadsheet_id)
+
+        start_row = index.last_row + 1
+        values = self.read_values(spreadsheet_id, 'A{}:F'.format(start_row))
+        index.update_rows(values, start_row)
+        return index
+
+    def _loaded_member_index(self, spreadsheet_id):
+        index = self.member_index(spreadsheet_id)
+        if not index.loaded:
+            self.load_member_index(spreadsheet_id)
+        return index
+
+    def save_user_to_sheets(self, spreadsheet_id: str, users):
         """
         Save one or multiple users to spreadsheet.
 
@@ -87,9 +365,6 @@ class ServiceAccount:
         Each user dict should have keys: 'id', 'name', 'username' (optional).
         """
 
-        prev_df = self.read_spreadsheet(spreadsheet_id, 'A:F')
-        prev_df['id'] = prev_df['id'].astype(str)
-
         if isinstance(users, dict):
             users = [users]
         elif not isinstance(users, list):
@@ -99,43 +374,266 @@ class ServiceAccount:
             # No users to add — exit early
             return
 
-        new_records = []
+        index = self._loaded_member_index(spreadsheet_id)
+
+        new_records = {}
         now_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         for user in users:
-            username = user.get("username") or ""
-            new_records.append({
-                "id": str(user["id"]),
-                "name": user.get("name", ""),
-                "username": username,
-                "join_date": now_str,
-                "deposit": 0,
-                "restricted": 0
-            })
-
-        new_df = pd.DataFrame(new_records)
-        new_df['id'] = new_df['id'].astype(str)
-
-        ids_prev = set(prev_df['id'])
-        filtered_new_df = new_df[~new_df['id'].isin(ids_prev)]
-
-        if not filtered_new_df.empty:
-            combined_df = pd.concat([prev_df, filtered_new_df], ignore_index=True)
-            self.write_spreadsheet(spreadsheet_id, combined_df)
+            user_id = str(user["id"])
+            if user_id in index or user_id in new_records:
+                continue
+            new_records[user_id] = MemberRecord(
+                row=0,
+                id=user_id,
+                name=user.get("name", ""),
+                username=user.get("username") or "",
+                join_date=now_str
+            )
+
+        if new_records:
+            records = list(new_records.values())
+            first_row = self.append_rows(spreadsheet_id, [record.to_values() for record in records])
+            for row, record in enumerate(records, first_row or index.last_row + 1):
+                record.row = row
+                index.add(record)
 
     def restrict_user(self, spreadsheet_id: str, username: str):
-        prev_df = self.read_spreadsheet(spreadsheet_id, 'A:F')
         if not username:
             raise ValueError("Username cannot be empty")
-        mask = prev_df['username'].str.lower() == username.lower()
-        if not mask.any():
+        if self.set_restricted(spreadsheet_id, [username])[username] == 'not_found':
             raise ValueError(f"The user @{username} is not in the database")
-        prev_df.loc[mask, 'restricted'] = 1
-        self.write_spreadsheet(spreadsheet_id, prev_df)
+
+    def read_ids(self, spreadsheet_id, rows):
+        """Read the id cells of the rows in one request.
+
+        :param spreadsheet_id: str  Spreadsheet ID. Can be retrieved from the URL.
+        :param rows: list[int]  Sheet row numbers.
+        :return: dict[int, str]  Id of every row, '' for an empty one.
+        """
+        rows = list(rows)
+        if not rows:
+            return {}
+
+        result = self.service.spreadsheets().values().batchGet(
+            spreadsheetId=spreadsheet_id,
+            ranges=['{}{}'.format(column_letter('id'), row) for row in rows]
+        ).execute(http=self._http())
+
+        value_ranges = result.get('valueRanges', [])
+        return {
+            row: str(((value_range.get('values') or [['']])[0] or [''])[0])
+            for row, value_range in zip(rows, value_ranges)
+        }
+
+    def _rows_hold(self, spreadsheet_id, records):
+        """Whether the sheet rows of the records still hold their users."""
+        ids = self.read_ids(spreadsheet_id, [record.row for record in records])
+        return all(ids.get(record.row) == record.id for record in records)
+
+    @staticmethod
+    def _resolve_restricted(index, targets, restricted):
+        """Return the result of every target and the records to be changed by id."""
+        value = 1 if restricted else 0
+        results = {}
+        changed = {}
+        for target in targets:
+            record = index.get(target) if target.isdigit() else index.find(target)
+            if record is None:
+                results[target] = 'not_found'
+            elif not restricted and to_float(record.deposit) > 0:
+                results[target] = 'deposit'
+            elif record.id in changed or str(record.restricted) == str(value):
+                results[target] = 'changed' if record.id in changed else 'unchanged'
+            else:
+                changed[record.id] = record
+                results[target] = 'changed'
+        return results, changed
+
+    def set_restricted(self, spreadsheet_id: str, targets, restricted=True):
+        """Mark or unmark many users as restricted with one write.
+
+        The rows of the index are checked against the id cells first, so a
+        sorted sheet or inserted rows do not make it write another user's cell.
+
+        :param spreadsheet_id: str  Spreadsheet ID. Can be retrieved from the URL.
+        :param targets: list[str]  Usernames (with or without @) or numeric user ids.
+        :param restricted: bool  Whether to restrict or unrestrict the users.
+        :return: dict[str, str]  Result for every target:
+            'changed', 'unchanged', 'not_found' or 'deposit' (a user with a positive
+            deposit stays restricted, so it can not be unrestricted).
+        """
+        index = self._loaded_member_index(spreadsheet_id)
+        value = 1 if restricted else 0
+
+        results, changed = self._resolve_restricted(index, targets, restricted)
+        if changed and not self._rows_hold(spreadsheet_id, changed.values()):
+            # Rows were sorted, inserted or deleted since the index was loaded
+            logger.info('Rows of spreadsheet "{}" have moved, reloading the members.'.format(spreadsheet_id))
+            index = self.load_member_index(spreadsheet_id)
+            results, changed = self._resolve_restricted(index, targets, restricted)
+            if changed and not self._rows_hold(spreadsheet_id, changed.values()):
+                raise RuntimeError('The rows of the spreadsheet are being moved, try again later')
+
+        if changed:
+            self.batch_update_cells(spreadsheet_id, [(record.row, 'restricted', value) for record in changed.values()])
+            for record in changed.values():
+                record.restricted = value
+        return results
+
+    def get_checksum(self, spreadsheet_id, cell):
+        """Read the checksum cell, one cell telling whether the watched columns have changed.
+
+        The last good value is used while the API is throttled.
+
+        :param spreadsheet_id: str  Spreadsheet ID. Can be retrieved from the URL.
+        :param cell: str  Cell with the checksum formula. Example: 'H1'
+        :return: str  Value of the cell, '' if it is empty.
+        """
+        with self.stale_reads():
+            values = self.read_values(spreadsheet_id, cell)
+        return str(values[0][0]) if values and values[0] else ''
 
     def get_restricted_user_ids(self, spreadsheet_id: str):
-        df = self.read_spreadsheet(spreadsheet_id, 'A:F')
-        df['deposit'] = df['deposit'].astype(float)
-        df.loc[df['deposit'] > 0, 'restricted'] = '1'
-        df['restricted'] = df['restricted'].astype(str)
-        self.write_spreadsheet(spreadsheet_id, df)
-        return set(df[df['restricted'] == '1']['id'].astype(int).tolist())
+        """Return ids of the restricted users.
+
+        Only the id, deposit and restricted columns are read. A user with a
+        positive deposit is restricted. Only the `restricted` cells that have
+        to be switched on are written, nothing is written when the sheet is
+        already consistent.
+
+        While the API is throttled the last good read is used, nothing is
+        written from it: its rows may have moved since.
+        """
+        with self.stale_reads() as stale:
+            columns = self.read_columns(spreadsheet_id, ['id', 'deposit', 'restricted'])
+        ids, deposits, restricted_flags = (columns[name][1:] for name in ('id', 'deposit', 'restricted'))
+        index = self.member_index(spreadsheet_id)
+
+        restricted_ids = set()
+        to_update = []
+        for offset, user_id in enumerate(ids):
+            if user_id == '':
+                continue
+            flag = restricted_flags[offset] if offset < len(restricted_flags) else ''
+            deposit = deposits[offset] if offset < len(deposits) else ''
+            if is_restricted(deposit, flag):
+                if to_float(flag) != 1:
+                    # Restricted by the deposit, the flag is switched on
+                    to_update.append((FIRST_ROW + offset, 'restricted', 1))
+                restricted_ids.add(int(user_id))
+
+        if stale.served:
+            logger.warning('Restricted users of spreadsheet "{}" are read from the last good response.'.format(
+                spreadsheet_id))
+            return restricted_ids
+
+        if to_update:
+            self.batch_update_cells(spreadsheet_id, to_update)
+            restricted_flags = list(restricted_flags)
+            restricted_flags += [''] * (len(ids) - len(restricted_flags))
+            for row, _, value in to_update:
+                restricted_flags[row - FIRST_ROW] = value
+
+        index.update_fields(ids, {'deposit': deposits, 'restricted': restricted_flags})
+        return restricted_ids
+
+
+class AsyncServiceAccount:
+
+    def __init__(self, credentials, scopes, service_name, version, max_workers=SHEETS_MAX_WORKERS):
+        """Non-blocking wrapper of `ServiceAccount`.
+
+        Blocking Sheets calls run in a bounded thread pool, so a slow request
+        does not freeze the event loop.
+
+        :param credentials: str  Path to service account json file.
+        :param scopes: list[str]  List of scopes.
+        :param service_name: str  Name of the service.
+        :param version: str  Version of the service.
+        :param max_workers: int  Max number of the concurrent Sheets requests.
+        """
+        self.sync = ServiceAccount(credentials, scopes, service_name, version)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='sheets')
+
+    async def _run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    def member_index(self, spreadsheet_id) -> MemberIndex:
+        return self.sync.member_index(spreadsheet_id)
+
+    async def keep_token_fresh(self, margin=TOKEN_REFRESH_MARGIN):
+        """Refresh the access token in the background before it expires,
+        so no Sheets request waits for the token endpoint."""
+        while True:
+            try:
+                expiry = await self._run(self.sync.refresh_credentials, margin)
+                delay = (expiry - datetime.utcnow()).total_seconds() - margin
+            except Exception as e:
+                logger.error('Failed to refresh the access token: {}'.format(e))
+                delay = 0
+            await asyncio.sleep(max(delay, 30))
+
+    async def read_values(self, spreadsheet_id, range_name):
+        return await self._run(self.sync.read_values, spreadsheet_id, range_name)
+
+    async def read_columns(self, spreadsheet_id, columns, value_render_option='UNFORMATTED_VALUE'):
+        return await self._run(self.sync.read_columns, spreadsheet_id, columns, value_render_option)
+
+    async def read_members(self, spreadsheet_id):
+        return await self._run(self.sync.read_members, spreadsheet_id)
+
+    async def read_spreadsheet(self, spreadsheet_id, range_name, header=True):
+        return await self._run(self.sync.read_spreadsheet, spreadsheet_id, range_name, header)
+
+    async def write_spreadsheet(self, spreadsheet_id, data, header=True):
+        return await self._run(self.sync.write_spreadsheet, spreadsheet_id, data, header)
+
+    async def append_rows(self, spreadsheet_id, rows, range_name='A:F'):
+        return await self._run(self.sync.append_rows, spreadsheet_id, rows, range_name)
+
+    async def load_member_index(self, spreadsheet_id):
+        return await self._run(self.sync.load_member_index, spreadsheet_id)
+
+    async def refresh_member_index(self, spreadsheet_id):
+        return await self._run(self.sync.refresh_member_index, spreadsheet_id)
+
+    async def save_user_to_sheets(self, spreadsheet_id, users):
+        return await self._run(self.sync.save_user_to_sheets, spreadsheet_id, users)
+
+    async def restrict_user(self, spreadsheet_id, username):
+        return await self._run(self.sync.restrict_user, spreadsheet_id, username)
+
+    async def read_ids(self, spreadsheet_id, rows):
+        return await self._run(self.sync.read_ids, spreadsheet_id, rows)
+
+    async def set_restricted(self, spreadsheet_id, targets, restricted=True):
+        return await self._run(self.sync.set_restricted, spreadsheet_id, targets, restricted)
+
+    async def batch_update(self, spreadsheet_id, data):
+        return await self._run(self.sync.batch_update, spreadsheet_id, data)
+
+    async def update_cells(self, spreadsheet_id, row, column, value):
+        return await self._run(self.sync.update_cells, spreadsheet_id, row, column, value)
+
+    async def batch_update_cells(self, spreadsheet_id, cells):
+        return await self._run(self.sync.batch_update_cells, spreadsheet_id, cells)
+
+    async def get_checksum(self, spreadsheet_id, cell):
+        return await self._run(self.sync.get_checksum, spreadsheet_id, cell)
+
+    async def get_restricted_user_ids(self, spreadsheet_id):
+        return await self._run(self.sync.get_restricted_user_ids, spreadsheet_id)
+
+
+_service_accounts = {}
+
+
+def get_service_account(credentials=SERVICE_ACCOUNT_CREDENTIALS, scopes=SCOPES, service_name='sheets',
+                        version='v4') -> AsyncServiceAccount:
+    """Return the process-wide service account, it is built on the first call."""
+    key = (str(credentials), tuple(scopes), service_name, version)
+    sa = _service_accounts.get(key)
+    if sa is None:
+        sa = _service_accounts[key] = AsyncServiceAccount(credentials, scopes, service_name, version)
+    return sa
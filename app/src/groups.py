@@ -0,0 +1,47 @@
+"""Registry of the groups served by the bot."""
+
+from config import GROUPS, GROUP_CHAT_ID, SPREADSHEET_ID
+
+
+class Group:
+    """Group chat and the spreadsheet of its members."""
+
+    __slots__ = ('chat_id', 'spreadsheet_id')
+
+    def __init__(self, chat_id, spreadsheet_id):
+        self.chat_id = int(chat_id)
+        self.spreadsheet_id = spreadsheet_id
+
+    def __repr__(self):
+        return 'Group(chat_id={}, spreadsheet_id={!r})'.format(self.chat_id, self.spreadsheet_id)
+
+
+def _load_groups():
+    groups = {}
+    if GROUP_CHAT_ID:
+        groups[int(GROUP_CHAT_ID)] = Group(GROUP_CHAT_ID, SPREADSHEET_ID)
+    for chat_id, spreadsheet_id in GROUPS.items():
+        groups[int(chat_id)] = Group(chat_id, spreadsheet_id)
+    return groups
+
+
+# chat_id -> Group
+groups = _load_groups()
+
+
+def get_group(chat_id) -> Group | None:
+    """Return the group served by the bot or None."""
+    try:
+        return groups.get(int(chat_id))
+    except (TypeError, ValueError):
+        return None
+
+
+def default_group() -> Group | None:
+    """Group used by the admin commands sent in the private chat."""
+    return next(iter(groups.values()), None)
+
+
+def get_groups_by_spreadsheet(spreadsheet_id) -> list[Group]:
+    """Return the groups whose members are kept in the spreadsheet."""
+    return [group for group in groups.values() if group.spreadsheet_id == spreadsheet_id]
@@ -0,0 +1,130 @@
+"""Election of the process running the jobs which must run once per host.
+
+The processes share a lease row in the state database. The holder renews it
+every `renew_interval` seconds, once it is not renewed for `ttl` seconds
+another process takes it over and starts the jobs.
+"""
+
+import asyncio
+import logging
+import os
+import socket
+import sqlite3
+import time
+import uuid
+
+from src.metrics import Gauge
+from src.utils import LOG_LEVEL, STATE_DB, LEADER_LEASE_TTL, LEADER_RENEW_INTERVAL
+
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
+
+class LeaderElection:
+
+    def __init__(self, name='jobs', path=STATE_DB, ttl=LEADER_LEASE_TTL, renew_interval=LEADER_RENEW_INTERVAL):
+        """SQLite lease held by one process at a time.
+
+        :param name: str  Lease name, processes competing for the same name elect one leader.
+        :param path: str | Path  Database file, shared by the processes of the host.
+        :param ttl: float  Seconds the lease is valid after the last renewal.
+        :param renew_interval: float  Seconds between the renewals, well below `ttl`.
+        """
+        self.name = name
+        self.path = path
+        self.ttl = ttl
+        self.renew_interval = renew_interval
+        self.holder = '{}:{}:{}'.format(socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8])
+        # Whether the jobs of the leader are running in this process
+        self.is_leader = False
+
+        self._conn = sqlite3.connect(path)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS leases ('
+            'name TEXT PRIMARY KEY, '
+            'holder TEXT NOT NULL, '
+            'expires REAL NOT NULL)'
+        )
+        self._conn.commit()
+
+    def try_acquire(self) -> bool:
+        """Take the lease if it is free or expired, or renew it if held already.
+
+        :return: bool  Whether the lease is held by this process.
+        """
+        # Wall clock, the monotonic one is not shared by the processes
+        now = time.time()
+        with self._conn:
+            # One statement, so the check and the update are atomic
+            cursor = self._conn.execute(
+                'INSERT INTO leases (name, holder, expires) VALUES (?, ?, ?) '
+                'ON CONFLICT (name) DO UPDATE SET holder = excluded.holder, expires = excluded.expires '
+                'WHERE leases.holder = excluded.holder OR leases.expires < ?',
+                (self.name, self.holder, now + self.ttl, now)
+            )
+        return cursor.rowcount == 1
+
+    def release(self):
+        """Give the lease up, so another process takes it over without waiting for it to expire."""
+        with self._conn:
+            self._conn.execute('DELETE FROM leases WHERE name = ? AND holder = ?', (self.name, self.holder))
+
+    async def _run_jobs(self, jobs):
+        await asyncio.gather(*(job() for job in jobs))
+
+    async def run(self, jobs):
+        """Run the jobs while this process holds the lease, they are cancelled once it is lost.
+
+        :param jobs: list[callable]  Functions returning the coroutines of the jobs,
+            they are called again every time the process is elected.
+        """
+        task = None
+        # When the lease held by this process was last renewed, it stays valid for `ttl` after that
+        renewed_at = None
+        try:
+            while True:
+                attempt = time.monotonic()
+                try:
+                    leader = self.try_acquire()
+                except sqlite3.Error as e:
+                    logger.error('Failed to renew the {} lease: {}'.format(self.name, e))
+                    # E.g. the database is locked for a moment, the jobs go on while
+                    # the lease stays valid until the next renewal
+                    leader = task is not None and renewed_at is not None and \
+                        attempt - renewed_at + self.renew_interval < self.ttl
+                else:
+                    renewed_at = attempt if leader else None
+
+                if leader and task is None:
+                    logger.info('{} is elected to run the {}'.format(self.holder, self.name))
+                    self.is_leader = True
+                    task = asyncio.create_task(self._run_jobs(jobs))
+                elif not leader and task is not None:
+                    logger.warning('{} has lost the {} lease, stopping them'.format(self.holder, self.name))
+                    self.is_leader = False
+                    task.cancel()
+                    await asyncio.gather(task, return_exceptions=True)
+                    task = None
+
+                if task is None or task.done():
+                    await asyncio.sleep(self.renew_interval)
+                else:
+                    await asyncio.wait({task}, timeout=self.renew_interval)
+                if task is not None and task.done():
+                    # A failed job stops the process like in the single process mode
+                    task.result()
+        finally:
+            self.is_leader = False
+            if task is not None:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                try:
+                    self.release()
+                except sqlite3.Error as e:
+                    logger.error('Failed to release the {} lease: {}'.format(self.name, e))
+
+
+election = LeaderElection()
+
+Gauge('leader', 'Whether the process runs the jobs of the leader.', function=lambda: {(): int(election.is_leader)})
@@ -0,0 +1,152 @@
+"""In-memory index of the members saved in the spreadsheet."""
+
+COLUMNS = ['id', 'name', 'username', 'join_date', 'deposit', 'restricted']
+
+# Row 1 of the sheet is the header
+FIRST_ROW = 2
+
+
+def column_letter(column):
+    """Return the A1 letter of the column given by name or zero-based number."""
+    number = COLUMNS.index(column) if isinstance(column, str) else column
+    letters = ''
+    number += 1
+    while number:
+        number, remainder = divmod(number - 1, 26)
+        letters = chr(ord('A') + remainder) + letters
+    return letters
+
+
+def to_float(value):
+    """Convert a cell value to a number, empty and invalid cells are 0."""
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def is_restricted(deposit, restricted):
+    """Whether the user of the row has to be restricted: the flag is set or the deposit is positive."""
+    return to_float(restricted) == 1 or to_float(deposit) > 0
+
+
+class MemberRecord:
+    """One row of the members sheet."""
+
+    __slots__ = ('row', 'id', 'name', 'username', 'join_date', 'deposit', 'restricted')
+
+    def __init__(self, row, id, name='', username='', join_date='', deposit=0, restricted=0):
+        self.row = row
+        self.id = str(id)
+        self.name = name
+        self.username = username
+        self.join_date = join_date
+        self.deposit = deposit
+        self.restricted = restricted
+
+    @classmethod
+    def from_values(cls, row, values):
+        """Build the record from the sheet values, missing trailing cells are empty."""
+        values = list(values) + [''] * (len(COLUMNS) - len(values))
+        return cls(row, *values[:len(COLUMNS)])
+
+    def to_values(self):
+        return [self.id, self.name, self.username, self.join_date, self.deposit, self.restricted]
+
+    def __repr__(self):
+        return 'MemberRecord(row={}, id={}, username={!r})'.format(self.row, self.id, self.username)
+
+
+class MemberIndex:
+
+    def __init__(self):
+        """Members of one spreadsheet indexed by id and by lowercase username."""
+        self.by_id = {}
+        self.by_username = {}
+        # Last sheet row seen in the index
+        self.last_row = FIRST_ROW - 1
+        self.loaded = False
+
+    def __len__(self):
+        return len(self.by_id)
+
+    def __contains__(self, user_id):
+        return str(user_id) in self.by_id
+
+    def get(self, user_id):
+        return self.by_id.get(str(user_id))
+
+    def find(self, username):
+        if not username:
+            return None
+        return self.by_username.get(username.lstrip('@').lower())
+
+    def add(self, record):
+        """Add the record or replace the one with the same id."""
+        old = self.by_id.get(record.id)
+        if old is not None and old.username:
+            self._drop_username(old)
+        self.by_id[record.id] = record
+        if record.username:
+            self.by_username[record.username.lower()] = record
+        self.last_row = max(self.last_row, record.row)
+
+    def _drop_username(self, record):
+        key = record.username.lower()
+        if self.by_username.get(key) is record:
+            del self.by_username[key]
+
+    def load(self, values, start_row=FIRST_ROW):
+        """Replace the index with the sheet rows without the header."""
+        self.by_id.clear()
+        self.by_username.clear()
+        self.last_row = start_row - 1
+        self.update_rows(values, start_row)
+        self.loaded = True
+
+    def update_rows(self, values, start_row=FIRST_ROW):
+        """Apply the sheet rows starting at `start_row`, only changed records are touched.
+
+        :param values: list[list]  Rows of the sheet without the header.
+        :param start_row: int  Sheet row number of the first row.
+        """
+        for row, row_values in enumerate(values, start_row):
+            if not row_values or not str(row_values[0]).strip():
+                continue
+            record = MemberRecord.from_values(row, row_values)
+            old = self.by_id.get(record.id)
+            if old is None or old.to_values() != record.to_values() or old.row != row:
+                self.add(record)
+            else:
+                self.last_row = max(self.last_row, row)
+
+    def update_fields(self, ids, fields, start_row=FIRST_ROW):
+        """Update a few fields of the known records from the projected columns.
+
+        A row which does not match the record of the same id means rows were
+        inserted or moved, the index is marked for a full reload then.
+
+        :param ids: list  Values of the id column without the header.
+        :param fields: dict[str, list]  Values of the other columns by field name.
+        :param start_row: int  Sheet row number of the first value.
+        """
+        for offset, user_id in enumerate(ids):
+            if user_id == '':
+                continue
+            record = self.by_id.get(str(user_id))
+            if record is None or record.row != start_row + offset:
+                self.loaded = False
+                continue
+            for field, values in fields.items():
+                setattr(record, field, values[offset] if offset < len(values) else '')
+
+
+# spreadsheet_id -> MemberIndex, shared by all the service accounts of the process
+_indexes = {}
+
+
+def get_member_index(spreadsheet_id) -> MemberIndex:
+    index = _indexes.get(spreadsheet_id)
+    if index is None:
+        index = _indexes[spreadsheet_id] = MemberIndex()
+    return index
@@ -0,0 +1,225 @@
+"""Minimal Prometheus metrics and the endpoint serving them.
+
+Only what the bot needs is implemented: counters, gauges and histograms with
+labels, rendered in the Prometheus text format. Updating a metric is a dict
+lookup and a couple of additions, so it can be done on the hot path.
+"""
+
+import asyncio
+import bisect
+import logging
+import threading
+
+from aiohttp import web
+
+from config import METRICS_HOST, METRICS_PORT
+from src.utils import LOG_LEVEL, METRICS_BUCKETS
+
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# name -> metric, in the order of registration
+registry = {}
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=''):
+    pairs = ['{}="{}"'.format(name, _escape(value)) for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        """Metric registered in the process-wide registry.
+
+        :param name: str  Metric name, e.g. 'sheets_requests_total'.
+        :param documentation: str  Help text.
+        :param labelnames: list[str]  Label names, values are given to `labels`.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        registry[name] = self
+
+    def labels(self, *values):
+        """Return the child of the label values, it is created on the first call."""
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _samples(self):
+        """Yield (suffix, label values, extra label, value) of every sample."""
+        raise NotImplementedError
+
+    def render(self):
+        lines = ['# HELP {} {}'.format(self.name, self.documentation), '# TYPE {} {}'.format(self.name, self.type)]
+        for suffix, values, extra, value in self._samples():
+            lines.append('{}{}{} {}'.format(
+                self.name, suffix, _format_labels(self.labelnames, values, extra), _format_value(value)))
+        return '\n'.join(lines)
+
+
+class _CounterChild:
+
+    __slots__ = ('value', '_lock')
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class Counter(Metric):
+    """Value that only goes up, e.g. number of requests."""
+
+    type = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def _samples(self):
+        for values, child in list(self._children.items()):
+            yield '', values, '', child.value
+
+
+class _GaugeChild:
+
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+
+class Gauge(Metric):
+    """Value that goes up and down, e.g. queue length.
+
+    With `function` the values are read at the scrape time only.
+    """
+
+    type = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), function=None):
+        """
+        :param function: callable  Returns {label values tuple: value} of the current state.
+        """
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value):
+        self.labels().set(value)
+
+    def _samples(self):
+        if self.function is not None:
+            for values, value in self.function().items():
+                yield '', values, '', value
+        for values, child in list(self._children.items()):
+            yield '', values, '', child.value
+
+
+class _HistogramChild:
+
+    __slots__ = ('buckets', 'counts', 'sum', '_lock')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # counts[i] is the number of observations in the bucket i, the last one is +Inf
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+
+class Histogram(Metric):
+    """Distribution of the observed values, e.g. request durations in seconds."""
+
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=METRICS_BUCKETS):
+        """
+        :param buckets: list[float]  Upper bounds of the buckets, +Inf is added.
+        """
+        super().__init__(name, documentation, labelnames)
+        self.buckets = sorted(buckets)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def _samples(self):
+        for values, child in list(self._children.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + [float('inf')], child.counts):
+                cumulative += count
+                yield '_bucket', values, 'le="{}"'.format(_format_value(bound)), cumulative
+            yield '_sum', values, '', child.sum
+            yield '_count', values, '', cumulative
+
+
+def render():
+    """Return all the metrics in the Prometheus text format."""
+    return '\n'.join(metric.render() for metric in list(registry.values())) + '\n'
+
+
+async def handle_metrics(request: web.Request):
+    return web.Response(body=render().encode(), headers={'Content-Type': CONTENT_TYPE})
+
+
+def create_metrics_app() -> web.Application:
+    app = web.Application()
+    app.router.add_get('/metrics', handle_metrics)
+    return app
+
+
+async def run_metrics_server(host=METRICS_HOST, port=METRICS_PORT):
+    runner = web.AppRunner(create_metrics_app(), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    logger.info('Metrics are served on {}:{}/metrics'.format(host, port))
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
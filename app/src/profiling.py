@@ -0,0 +1,161 @@
+"""Sampling profiler of the live process and the event loop watchdog."""
+
+import asyncio
+import collections
+import logging
+import sys
+import threading
+import time
+import traceback
+
+from src.metrics import Histogram
+from src.utils import (
+    LOG_LEVEL,
+    LOOP_LAG_THRESHOLD,
+    LOOP_WATCHDOG_INTERVAL,
+    PROFILE_INTERVAL,
+    PROFILE_TOP,
+)
+
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
+LOOP_LAG = Histogram('event_loop_lag_seconds', 'Delay of the event loop in running a ready callback.')
+
+
+def _thread_group(name):
+    """Thread name without the worker number, e.g. 'sheets_3' -> 'sheets'."""
+    return name.rstrip('0123456789').rstrip('_-') or name
+
+
+def _frame_key(frame):
+    code = frame.f_code
+    return '{} ({}:{})'.format(code.co_name, code.co_filename, code.co_firstlineno)
+
+
+class SamplingProfiler:
+
+    def __init__(self, interval=PROFILE_INTERVAL, top=PROFILE_TOP):
+        """Statistical profiler sampling the stacks of all the threads.
+
+        Nothing is installed in the profiled threads, the stacks are read
+        with `sys._current_frames` from the profiling thread, so the overhead
+        is paid only while it runs. A thread holding the GIL is sampled at the
+        switch interval only, so the code blocking the loop shows up, while the
+        short callbacks between the I/O waits are under-represented.
+
+        :param interval: float  Seconds between the samples.
+        :param top: int  Number of the functions in the report tables.
+        """
+        self.interval = interval
+        self.top = top
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self._lock.locked()
+
+    def sample(self, seconds) -> str:
+        """Sample the process for `seconds`, blocking, run it in a separate thread.
+
+        :return: str  Report with the hottest functions of every thread group
+            and the folded stacks, which can be fed to flamegraph.pl.
+        """
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError('The profiler is already running')
+        try:
+            return self._sample(seconds)
+        finally:
+            self._lock.release()
+
+    def _sample(self, seconds):
+        own_id = threading.get_ident()
+        # thread group -> function -> samples
+        own_samples = collections.defaultdict(collections.Counter)
+        total_samples = collections.defaultdict(collections.Counter)
+        stacks = collections.Counter()
+        threads = collections.Counter()
+        count = 0
+
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                group = _thread_group(names.get(thread_id, str(thread_id)))
+                threads[group] += 1
+
+                keys = []
+                while frame is not None:
+                    keys.append(_frame_key(frame))
+                    frame = frame.f_back
+                own_samples[group][keys[0]] += 1
+                for key in set(keys):
+                    total_samples[group][key] += 1
+                stacks[';'.join([group] + keys[::-1])] += 1
+            count += 1
+            time.sleep(self.interval)
+
+        lines = ['Profile of {:.1f} s, {} samples every {} ms'.format(seconds, count, self.interval * 1000), '']
+        for group, samples in threads.most_common():
+            lines.append('== Thread {} ({} samples) =='.format(group, samples))
+            for title, counter in (('Own', own_samples[group]), ('Total', total_samples[group])):
+                lines.append('{:>8} {:>7}  function'.format(title, '%'))
+                for key, number in counter.most_common(self.top):
+                    lines.append('{:>8} {:>6.1f}%  {}'.format(number, 100 * number / samples, key))
+                lines.append('')
+
+        lines.append('== Folded stacks ==')
+        lines.extend('{} {}'.format(stack, number) for stack, number in stacks.most_common())
+        return '\n'.join(lines) + '\n'
+
+
+class LoopWatchdog:
+
+    def __init__(self, threshold=LOOP_LAG_THRESHOLD, interval=LOOP_WATCHDOG_INTERVAL):
+        """Log the stack of the code blocking the event loop.
+
+        A task updates the heartbeat every `interval` seconds. A thread checks
+        it, and once the heartbeat is older than `threshold` seconds the stack
+        of the loop thread is logged, it is the stack of the blocking callback.
+
+        :param threshold: float  Seconds the loop can be blocked without a warning.
+        :param interval: float  Seconds between the heartbeats.
+        """
+        self.threshold = threshold
+        self.interval = interval
+        self._heartbeat = time.monotonic()
+        self._loop_thread_id = None
+
+    def _watch(self):
+        reported = None
+        while True:
+            time.sleep(self.interval)
+            heartbeat = self._heartbeat
+            # The heartbeat is due `interval` seconds after the previous one
+            blocked = time.monotonic() - heartbeat - self.interval
+            if blocked < self.threshold or reported == heartbeat:
+                continue
+            # Report every stall once
+            reported = heartbeat
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = ''.join(traceback.format_stack(frame)) if frame is not None else ''
+            logger.warning('Event loop is blocked for {:.2f}s in:\n{}'.format(blocked, stack),
+                           extra={'blocked_seconds': round(blocked, 3)})
+
+    async def run(self):
+        """Update the heartbeat and measure the loop lag, the watching thread is started on the first call."""
+        loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        threading.Thread(target=self._watch, name='loop-watchdog', daemon=True).start()
+
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            LOOP_LAG.observe(max(0.0, loop.time() - start - self.interval))
+            self._heartbeat = time.monotonic()
+
+
+profiler = SamplingProfiler()
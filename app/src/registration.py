@@ -0,0 +1,166 @@
+"""Write-behind registration of the group members in the spreadsheet."""
+
+import asyncio
+import logging
+from datetime import datetime
+
+from src.members import MemberRecord
+from src.utils import LOG_LEVEL, REGISTRATION_FLUSH_INTERVAL, REGISTRATION_FLUSH_SIZE
+
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
+
+class MemberRegistrationQueue:
+
+    def __init__(self, sa, spreadsheet_id, flush_interval=REGISTRATION_FLUSH_INTERVAL,
+                 flush_size=REGISTRATION_FLUSH_SIZE, chat_id=None, election=None, handoff=None):
+        """Queue of the new members waiting to be appended to the spreadsheet.
+
+        Handlers only call `register`, which is a couple of dict lookups.
+        The spreadsheet is written by `run` in the background.
+
+        With several processes only the elected one writes the spreadsheet,
+        the others pass the new members to it through the `handoff` store.
+
+        :param sa: AsyncServiceAccount  Sheets service account.
+        :param spreadsheet_id: str  Spreadsheet ID.
+        :param flush_interval: int  Max seconds a new member waits in the queue.
+        :param flush_size: int  Number of queued members that triggers a flush right away.
+        :param chat_id: int  Group chat ID, the key of the members in the `handoff` store.
+        :param election: LeaderElection  Election of the writing process, the queue always writes if None.
+        :param handoff: MemberHandoffStore  Members passed by the other processes.
+        """
+        self.sa = sa
+        self.spreadsheet_id = spreadsheet_id
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.chat_id = chat_id
+        self.election = election
+        self.handoff = handoff
+
+        # Members already saved in the spreadsheet
+        self.index = sa.member_index(spreadsheet_id)
+        # id -> record waiting to be appended
+        self._pending = {}
+        # Ids passed to the leader, it saves them
+        self._handed_off = set()
+        self._flush_event = asyncio.Event()
+
+    @property
+    def pending(self) -> int:
+        """Number of the members waiting to be saved."""
+        return len(self._pending)
+
+    def register(self, user_id, name, username) -> bool:
+        """Queue the user unless already saved or queued.
+
+        :return: bool  Whether the user was queued.
+        """
+        user_id = str(user_id)
+        if user_id in self.index.by_id or user_id in self._pending or user_id in self._handed_off:
+            return False
+
+        self._pending[user_id] = MemberRecord(
+            row=0,
+            id=user_id,
+            name=name or "",
+            username=username or "",
+            join_date=datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        )
+        if len(self._pending) >= self.flush_size:
+            self._flush_event.set()
+        return True
+
+    async def load_members(self):
+        """Load the members index, retrying until the spreadsheet is available."""
+        while not self.index.loaded:
+            try:
+                await self.sa.load_member_index(self.spreadsheet_id)
+            except Exception as e:
+                logger.error('Failed to load known members: {}'.format(e))
+                await asyncio.sleep(self.flush_interval)
+
+    @property
+    def is_writer(self) -> bool:
+        """Whether this process writes the spreadsheet."""
+        return self.election is None or self.election.is_leader
+
+    def hand_off(self):
+        """Pass the queued members to the leader process."""
+        if not self._pending:
+            return
+
+        batch, self._pending = self._pending, {}
+        try:
+            self.handoff.put(self.chat_id, list(batch.values()))
+        except Exception as e:
+            logger.error('Failed to hand off {} new members: {}'.format(len(batch), e))
+            for user_id, record in batch.items():
+                self._pending.setdefault(user_id, record)
+            return
+        self._handed_off.update(batch)
+
+    async def refresh_handed_off(self):
+        """Pick up the members saved by the leader, so this process knows them as well."""
+        if not self._handed_off:
+            return
+        try:
+            await self.sa.refresh_member_index(self.spreadsheet_id)
+        except Exception as e:
+            logger.error('Failed to refresh known members: {}'.format(e))
+            return
+        self._handed_off.difference_update(self.index.by_id)
+
+    async def flush(self):
+        """Append all the queued members and the ones handed off by the other processes in one request."""
+        if not self.is_writer:
+            self.hand_off()
+            await self.refresh_handed_off()
+            return
+
+        handed_off = self.handoff.load(self.chat_id) if self.handoff is not None else []
+        if not self._pending and not handed_off:
+            return
+
+        batch, self._pending = self._pending, {}
+        for record in handed_off:
+            batch.setdefault(record.id, record)
+
+        try:
+            # Pick up the rows added to the sheet by someone else
+            await self.sa.refresh_member_index(self.spreadsheet_id)
+            records = [record for user_id, record in batch.items() if user_id not in self.index.by_id]
+            if records:
+                first_row = await self.sa.append_rows(
+                    self.spreadsheet_id, [record.to_values() for record in records]
+                )
+        except Exception as e:
+            logger.error('Failed to save {} new members: {}'.format(len(batch), e))
+            # Keep them for the next flush, the handed off ones stay in the store
+            handed_off_ids = {record.id for record in handed_off}
+            for user_id, record in batch.items():
+                if user_id not in handed_off_ids:
+                    self._pending.setdefault(user_id, record)
+            return
+
+        if records:
+            for row, record in enumerate(records, first_row or self.index.last_row + 1):
+                record.row = row
+                self.index.add(record)
+        if handed_off:
+            self.handoff.delete(self.chat_id, [record.id for record in handed_off])
+
+    async def run(self):
+        """Flush the queue every `flush_interval` seconds or once it holds `flush_size` members.
+
+        It runs in every process, the ones which are not elected hand the members off.
+        """
+        await self.load_members()
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_event.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_event.clear()
+            await self.flush()
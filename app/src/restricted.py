@@ -1,50 +1,314 @@
+import asyncio
+import logging
+import time
+
+from aiogram.exceptions import TelegramRetryAfter
 from aiogram.types import ChatPermissions
 
-from config import SPREADSHEET_ID, GROUP_CHAT_ID
-from src.utils import SERVICE_ACCOUNT_CREDENTIALS, SCOPES
-from src.google_spreadsheets import ServiceAccount
+from config import SHEET_CHECKSUM_CELL
+from src.utils import (
+    LOG_LEVEL,
+    RESTRICT_CONCURRENCY,
+    RESTRICT_RATE,
+    RESTRICT_FLOOD_RETRIES,
+    RESTRICT_RETRY_DELAY,
+    RESTRICT_MAX_RETRY_DELAY,
+    POLL_FULL_CHECK_INTERVAL,
+    RESTRICT_AUDIT_BATCH,
+)
+from src.utils.rate_limit import TokenBucket
+from src.google_spreadsheets import get_service_account
+from src.groups import groups
+from src.members import is_restricted
+from src.metrics import Counter, Gauge, Histogram
+from src.state import RestrictionStore
 
-sa = ServiceAccount(SERVICE_ACCOUNT_CREDENTIALS, SCOPES, 'sheets', 'v4')
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
 
-restricted_cache = set()
+CHECK_DURATION = Histogram('reconcile_check_duration_seconds',
+                           'Duration of a restrictions check of the group.', ['chat_id'])
+CHECK_ERRORS = Counter('reconcile_check_errors_total', 'Failed restrictions checks.', ['chat_id'])
+SHEET_READS = Counter('reconcile_sheet_reads_total', 'Checks which read the restricted users from the sheet.',
+                      ['chat_id'])
+DIFF_USERS = Gauge('reconcile_diff_users', 'Users to be restricted or unrestricted found by the last check.',
+                   ['chat_id', 'action'])
+APPLIED = Counter('restrictions_applied_total', 'Restrictions applied and lifted in the group.',
+                  ['chat_id', 'action'])
 
+sa = get_service_account()
+store = RestrictionStore()
 
-async def check_restricted_users(bot):
-    """
-    Background check of restricted users every 5 seconds.
-    If a user is added to restricted, he will be restricted in the group.
-    If removed from restricted, restrictions will be removed.
-    """
-    global restricted_cache
+# Telegram limits apply to the whole bot, so all the groups share them
+limiter = TokenBucket(RESTRICT_RATE)
+semaphore = asyncio.Semaphore(RESTRICT_CONCURRENCY)
 
-    try:
-        current_restricted = sa.get_restricted_user_ids(SPREADSHEET_ID)
-        print(current_restricted)
-        to_restrict = current_restricted - restricted_cache
-        for user_id in to_restrict:
-            try:
-                await bot.restrict_chat_member(
-                    chat_id=GROUP_CHAT_ID,
-                    user_id=user_id,
-                    permissions=ChatPermissions(can_send_messages=False)
-                )
-                print(f"[+] Restricted: {user_id}")
-            except Exception as e:
-                print(f"[!] Error in restricting {user_id}: {e}")
 
-        to_unrestrict = restricted_cache - current_restricted
-        for user_id in to_unrestrict:
+class RestrictionExecutor:
+
+    def __init__(self, chat_id, limiter=limiter, semaphore=semaphore):
+        """Apply restrictions concurrently within the Telegram rate limits.
+
+        :param chat_id: int | str  Group chat ID.
+        :param limiter: TokenBucket  Rate limiter of the requests.
+        :param semaphore: asyncio.Semaphore  Limit of the requests in flight.
+        """
+        self.chat_id = chat_id
+        self.limiter = limiter
+        self._semaphore = semaphore
+        # user_id -> (failed attempts, monotonic time of the next attempt)
+        self.retry_queue = {}
+
+    def is_due(self, user_id, now):
+        entry = self.retry_queue.get(user_id)
+        return entry is None or entry[1] <= now
+
+    def _schedule_retry(self, user_id):
+        attempts = self.retry_queue.get(user_id, (0, 0))[0] + 1
+        delay = min(RESTRICT_RETRY_DELAY * 2 ** (attempts - 1), RESTRICT_MAX_RETRY_DELAY)
+        self.retry_queue[user_id] = (attempts, time.monotonic() + delay)
+
+    async def _set_restricted(self, bot, user_id, restricted: bool) -> bool:
+        """Restrict or unrestrict the user, return whether it succeeded."""
+        async with self._semaphore:
+            for _ in range(RESTRICT_FLOOD_RETRIES + 1):
+                await self.limiter.acquire()
+                try:
+                    await bot.restrict_chat_member(
+                        chat_id=self.chat_id,
+                        user_id=user_id,
+                        permissions=ChatPermissions(can_send_messages=not restricted)
+                    )
+                except TelegramRetryAfter as e:
+                    # Flood control applies to the whole bot, hold every request
+                    self.limiter.pause(e.retry_after)
+                    logger.warning('Flood control, retry {} in {}s'.format(user_id, e.retry_after),
+                                   extra={'chat_id': self.chat_id, 'user_id': user_id})
+                    continue
+                except Exception as e:
+                    if restricted:
+                        logger.error('Error in restricting {} in {}: {}'.format(user_id, self.chat_id, e),
+                                     extra={'chat_id': self.chat_id, 'user_id': user_id})
+                    else:
+                        logger.error('Error removing restriction {} in {}: {}'.format(user_id, self.chat_id, e),
+                                     extra={'chat_id': self.chat_id, 'user_id': user_id})
+                    break
+
+                self.retry_queue.pop(user_id, None)
+                if restricted:
+                    logger.info('Restricted: {} in {}'.format(user_id, self.chat_id),
+                                extra={'chat_id': self.chat_id, 'user_id': user_id})
+                else:
+                    logger.info('The restriction has been lifted: {} in {}'.format(user_id, self.chat_id),
+                                extra={'chat_id': self.chat_id, 'user_id': user_id})
+                return True
+
+        self._schedule_retry(user_id)
+        return False
+
+    async def apply(self, bot, to_restrict, to_unrestrict, full_diff=True):
+        """Apply the changes, users waiting for a retry are skipped until it is due.
+
+        :param full_diff: bool  Whether the changes are the whole diff of the group,
+            retries of users out of it are forgotten then.
+        :return: tuple[set, set]  Users actually restricted and unrestricted.
+        """
+        now = time.monotonic()
+        if full_diff:
+            # Forget the retries of users which are no longer in the diff
+            pending = to_restrict | to_unrestrict
+            for user_id in list(self.retry_queue):
+                if user_id not in pending:
+                    del self.retry_queue[user_id]
+
+        jobs = [(user_id, True) for user_id in to_restrict if self.is_due(user_id, now)]
+        jobs += [(user_id, False) for user_id in to_unrestrict if self.is_due(user_id, now)]
+        results = await asyncio.gather(
+            *(self._set_restricted(bot, user_id, restricted) for user_id, restricted in jobs)
+        )
+
+        restricted = {user_id for (user_id, flag), ok in zip(jobs, results) if ok and flag}
+        unrestricted = {user_id for (user_id, flag), ok in zip(jobs, results) if ok and not flag}
+        return restricted, unrestricted
+
+
+class GroupReconciler:
+
+    def __init__(self, group, checksum_cell=SHEET_CHECKSUM_CELL):
+        """Keep the restrictions of the group in sync with its spreadsheet.
+
+        :param group: Group  Served group.
+        :param checksum_cell: str  Cell whose change triggers the read of the columns, they are read
+            on every check if empty.
+        """
+        self.group = group
+        self.checksum_cell = checksum_cell
+        self.executor = RestrictionExecutor(group.chat_id)
+        # Users whose restriction is applied in the group, kept from the previous run
+        self.restricted_cache = store.load(group.chat_id)
+        # Restricted users read from the sheet by the last check and the checksum read before them
+        self._current_restricted = set()
+        self._checksum = None
+        self._last_full_check = 0.0
+        # Checks and pushed edits of the group are applied one at a time
+        self._lock = asyncio.Lock()
+
+    def reload(self):
+        """Start over from the stored restrictions, another process may have changed them."""
+        self.restricted_cache = store.load(self.group.chat_id)
+        self.executor.retry_queue.clear()
+        self._current_restricted = set()
+        self._checksum = None
+        self._last_full_check = 0.0
+
+    async def check(self, bot) -> bool:
+        """
+        Check restricted users of the group.
+        If a user is added to restricted, the user will be restricted in the group.
+        If removed from restricted, restrictions will be removed.
+        Failed users stay out of the cache and are retried with a backoff.
+        With the checksum cell the columns are read only when it has changed.
+
+        :return: bool  Whether the restricted users have changed since the previous check.
+        """
+        async with self._lock:
+            return await self._check(bot)
+
+    async def _check(self, bot) -> bool:
+        spreadsheet_id = self.group.spreadsheet_id
+        chat_id = str(self.group.chat_id)
+        start = time.perf_counter()
+        try:
+            # Read before the columns, an edit made in between changes it again for the next check
+            checksum = await sa.get_checksum(spreadsheet_id, self.checksum_cell) if self.checksum_cell else ''
+            changed = False
+            if not checksum or checksum != self._checksum or \
+                    time.monotonic() - self._last_full_check >= POLL_FULL_CHECK_INTERVAL:
+                restricted_ids = await sa.get_restricted_user_ids(spreadsheet_id)
+                changed = restricted_ids != self._current_restricted
+                self._current_restricted = restricted_ids
+                self._checksum = checksum
+                self._last_full_check = time.monotonic()
+                SHEET_READS.labels(chat_id).inc()
+                if changed:
+                    logger.info('{} restricted users read for {}'.format(len(restricted_ids), self.group.chat_id),
+                                extra={'chat_id': self.group.chat_id})
+
+            to_restrict = self._current_restricted - self.restricted_cache
+            to_unrestrict = self.restricted_cache - self._current_restricted
+            DIFF_USERS.labels(chat_id, 'restrict').set(len(to_restrict))
+            DIFF_USERS.labels(chat_id, 'unrestrict').set(len(to_unrestrict))
+            await self._apply(bot, to_restrict, to_unrestrict)
+            return changed
+
+        except Exception as e:
+            CHECK_ERRORS.labels(chat_id).inc()
+            logger.exception('General restricted user verification error in {}: {}'.format(self.group.chat_id, e),
+                             extra={'chat_id': self.group.chat_id})
+            return False
+
+        finally:
+            CHECK_DURATION.labels(chat_id).observe(time.perf_counter() - start)
+
+    async def _apply(self, bot, to_restrict, to_unrestrict, full_diff=True):
+        """Apply the changes and save the ones which succeeded."""
+        restricted, unrestricted = await self.executor.apply(bot, to_restrict, to_unrestrict, full_diff)
+        self.restricted_cache = (self.restricted_cache | restricted) - unrestricted
+        store.update(self.group.chat_id, restricted, unrestricted)
+        chat_id = str(self.group.chat_id)
+        APPLIED.labels(chat_id, 'restrict').inc(len(restricted))
+        APPLIED.labels(chat_id, 'unrestrict').inc(len(unrestricted))
+        return restricted, unrestricted
+
+    async def apply_rows(self, bot, rows):
+        """
+        Apply the restrictions of the edited rows right away, without reading the sheet.
+
+        :param rows: list[dict]  Edited rows with 'id' and the 'deposit' and 'restricted' values,
+            a missing value is taken from the member index.
+        :return: dict[str, list[int]]  Users restricted, unrestricted and failed.
+        """
+        async with self._lock:
+            index = sa.member_index(self.group.spreadsheet_id)
+            desired = {}
+            for row in rows:
+                record = index.get(row['id'])
+                if record is not None:
+                    record.deposit = row.get('deposit', record.deposit)
+                    record.restricted = row.get('restricted', record.restricted)
+                    desired[int(row['id'])] = is_restricted(record.deposit, record.restricted)
+                else:
+                    desired[int(row['id'])] = is_restricted(row.get('deposit'), row.get('restricted'))
+
+            # The next check must not revert the pushed state
+            for user_id, restricted in desired.items():
+                if restricted:
+                    self._current_restricted.add(user_id)
+                else:
+                    self._current_restricted.discard(user_id)
+
+            to_restrict = {user_id for user_id, restricted in desired.items()
+                           if restricted and user_id not in self.restricted_cache}
+            to_unrestrict = {user_id for user_id, restricted in desired.items()
+                             if not restricted and user_id in self.restricted_cache}
+            # Users pushed explicitly are not kept waiting for their retry
+            for user_id in to_restrict | to_unrestrict:
+                self.executor.retry_queue.pop(user_id, None)
+
+            restricted, unrestricted = await self._apply(bot, to_restrict, to_unrestrict, full_diff=False)
+
+        return {
+            'restricted': sorted(restricted),
+            'unrestricted': sorted(unrestricted),
+            'failed': sorted((to_restrict | to_unrestrict) - restricted - unrestricted),
+        }
+
+    async def audit(self, bot, batch_size=RESTRICT_AUDIT_BATCH):
+        """
+        Check the stored restrictions against the group.
+        Users who are not actually restricted are dropped from the cache,
+        so the next check restricts them again.
+        """
+        chat_id = self.group.chat_id
+
+        async def check_member(user_id):
+            await self.executor.limiter.acquire()
             try:
-                await bot.restrict_chat_member(
-                    chat_id=GROUP_CHAT_ID,
-                    user_id=user_id,
-                    permissions=ChatPermissions(can_send_messages=True)
-                )
-                print(f"[-] The restriction has been lifted: {user_id}")
+                member = await bot.get_chat_member(chat_id=chat_id, user_id=user_id)
             except Exception as e:
-                print(f"[!] Error removing restriction {user_id}: {e}")
+                logger.error('Error in auditing {} in {}: {}'.format(user_id, chat_id, e),
+                             extra={'chat_id': chat_id, 'user_id': user_id})
+                # Keep the user, the restriction can not be checked
+                return True
+            return member.status == 'restricted' and not member.can_send_messages
+
+        user_ids = list(self.restricted_cache)
+        stale = set()
+        for start in range(0, len(user_ids), batch_size):
+            batch = user_ids[start:start + batch_size]
+            results = await asyncio.gather(*(check_member(user_id) for user_id in batch))
+            stale.update(user_id for user_id, ok in zip(batch, results) if not ok)
+
+        self.restricted_cache -= stale
+        store.update(chat_id, unrestricted=stale)
+        logger.info('Audit of {} restrictions in {} done, {} to be applied again'.format(
+            len(user_ids), chat_id, len(stale)), extra={'chat_id': chat_id})
+
+
+# chat_id -> GroupReconciler
+reconcilers = {chat_id: GroupReconciler(group) for chat_id, group in groups.items()}
+
+Gauge('restricted_users', 'Users restricted in the group by the bot.', ['chat_id'],
+      function=lambda: {(str(chat_id),): len(r.restricted_cache) for chat_id, r in reconcilers.items()})
+Gauge('restrict_retry_queue_users', 'Users waiting for a retry of a failed restriction.', ['chat_id'],
+      function=lambda: {(str(chat_id),): len(r.executor.retry_queue) for chat_id, r in reconcilers.items()})
+
+
+async def check_restricted_users(bot, chat_id) -> bool:
+    """Check restricted users of the group, see `GroupReconciler.check`."""
+    return await reconcilers[chat_id].check(bot)
 
-        restricted_cache = current_restricted
 
-    except Exception as e:
-        print(f"[!] General restricted user verification error: {e}")
+async def audit_restrictions(bot, chat_id, batch_size=RESTRICT_AUDIT_BATCH):
+    """Check the stored restrictions of the group, see `GroupReconciler.audit`."""
+    await reconcilers[chat_id].audit(bot, batch_size)
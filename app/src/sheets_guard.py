@@ -0,0 +1,286 @@
+"""Guard of the Sheets API quota in front of every request of `ServiceAccount`.
+
+- Identical reads sent at the same time share one request.
+- Requests are sent within the per-minute budget of reads and writes.
+- Requests failed with 429 or 5xx are retried with an exponential backoff and jitter.
+- After several failures in a row the API is not called for a while,
+  reads are served from the last good responses meanwhile (degraded mode),
+  only inside `stale_reads`, so the caller knows the data may be out of date.
+
+It works on the http level, so the methods of `ServiceAccount` are unchanged.
+Everything here runs in the Sheets worker threads and blocks.
+"""
+
+import collections
+import contextlib
+import logging
+import random
+import threading
+import time
+from concurrent.futures import Future
+
+import httplib2
+
+from src.metrics import Counter, Gauge
+from src.utils import (
+    LOG_LEVEL,
+    SHEETS_READS_PER_MINUTE,
+    SHEETS_WRITES_PER_MINUTE,
+    SHEETS_QUOTA_BURST,
+    SHEETS_QUOTA_MAX_WAIT,
+    SHEETS_RETRIES,
+    SHEETS_RETRY_DELAY,
+    SHEETS_MAX_RETRY_DELAY,
+    SHEETS_BREAKER_THRESHOLD,
+    SHEETS_BREAKER_COOLDOWN,
+    SHEETS_SNAPSHOTS,
+)
+from src.utils.rate_limit import ThreadTokenBucket
+
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
+GUARD_EVENTS = Counter('sheets_guard_events_total',
+                       'Sheets requests coalesced, retried, served from the snapshot or rejected.', ['event'])
+
+# Guards of all the service accounts, for the circuit gauge
+_guards = []
+
+Gauge('sheets_circuit_open', 'Whether the Sheets API is not called after repeated failures.',
+      function=lambda: {(): int(any(guard.is_open for guard in _guards))})
+
+
+class SheetsUnavailable(Exception):
+    """The request is not sent, the API is throttled and there is no snapshot to serve."""
+
+
+class StaleReads:
+    """Reads allowed to be served from the snapshots, `served` tells whether one was."""
+
+    def __init__(self):
+        self.served = False
+
+
+def _is_retryable(status):
+    return status == 429 or status >= 500
+
+
+class SheetsGuard:
+
+    def __init__(self, reads_per_minute=SHEETS_READS_PER_MINUTE, writes_per_minute=SHEETS_WRITES_PER_MINUTE,
+                 burst=SHEETS_QUOTA_BURST, max_wait=SHEETS_QUOTA_MAX_WAIT, retries=SHEETS_RETRIES,
+                 retry_delay=SHEETS_RETRY_DELAY, max_retry_delay=SHEETS_MAX_RETRY_DELAY,
+                 failure_threshold=SHEETS_BREAKER_THRESHOLD, cooldown=SHEETS_BREAKER_COOLDOWN,
+                 snapshots=SHEETS_SNAPSHOTS):
+        """Quota budget, retries and circuit breaker shared by the threads of a service account.
+
+        :param reads_per_minute: float  Budget of the GET requests.
+        :param writes_per_minute: float  Budget of the other requests.
+        :param burst: int  Max number of the requests sent at once.
+        :param max_wait: float  Max seconds a request waits for the budget.
+        :param retries: int  Retries of a failed request.
+        :param retry_delay: float  Delay of the first retry, seconds.
+        :param max_retry_delay: float  Max delay of a retry, seconds.
+        :param failure_threshold: int  Failures in a row opening the circuit.
+        :param cooldown: float  Seconds the circuit stays open before a probe request.
+        :param snapshots: int  Number of the last good read responses kept.
+        """
+        self.max_wait = max_wait
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.snapshots = snapshots
+
+        self._reads = ThreadTokenBucket(reads_per_minute / 60, burst)
+        self._writes = ThreadTokenBucket(writes_per_minute / 60, burst)
+        self._lock = threading.Lock()
+        # uri -> Future of the read in flight
+        self._in_flight = {}
+        # uri -> (response, content) of the last good read
+        self._snapshots = collections.OrderedDict()
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        # StaleReads of the block the thread is in, if any
+        self._thread = threading.local()
+        _guards.append(self)
+
+    @property
+    def is_open(self) -> bool:
+        return self._opened_at is not None
+
+    @contextlib.contextmanager
+    def stale_reads(self):
+        """Let the reads of the block in this thread be served from the last good responses.
+
+        Outside of the block a read which can not be sent fails instead, so the
+        data a write is based on is never a snapshot.
+
+        :return: StaleReads  Whether a read of the block was served from a snapshot.
+        """
+        previous = getattr(self._thread, 'stale_reads', None)
+        reads = self._thread.stale_reads = StaleReads()
+        try:
+            yield reads
+        finally:
+            self._thread.stale_reads = previous
+
+    def request(self, send, uri, method='GET'):
+        """Send the request through the guard.
+
+        :param send: callable  Sends the request, returns (response, content).
+        :param uri: str  Request URI, identical GET requests are coalesced.
+        :param method: str  HTTP method, GET requests are reads.
+        :return: tuple  (response, content) of the request, or of its snapshot within `stale_reads`.
+        """
+        if method != 'GET':
+            return self._send(send, uri, read=False)[0]
+
+        with self._lock:
+            future = self._in_flight.get(uri)
+            owner = future is None
+            if owner:
+                future = self._in_flight[uri] = Future()
+        if not owner:
+            GUARD_EVENTS.labels('coalesced').inc()
+            try:
+                result, stale = future.result()
+            except (OSError, httplib2.HttpLib2Error, SheetsUnavailable):
+                snapshot = self._stale(uri)
+                if snapshot is None:
+                    raise
+                return snapshot
+            if not stale:
+                return result
+            # The request was served from the snapshot, which this caller may not accept
+            snapshot = self._stale(uri)
+            if snapshot is None:
+                raise SheetsUnavailable('Sheets API is throttled, try again later')
+            return snapshot
+
+        try:
+            result, stale = self._send(send, uri, read=True)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result((result, stale))
+            return result
+        finally:
+            with self._lock:
+                del self._in_flight[uri]
+
+    def _send(self, send, uri, read):
+        """Send the request with retries, return its result and whether it is a snapshot."""
+        bucket = self._reads if read else self._writes
+        attempt = 0
+        while True:
+            if not self._allow():
+                return self._degraded(uri, read, 'the circuit is open after repeated failures')
+            if not bucket.acquire(self.max_wait):
+                return self._degraded(uri, read, 'out of the request budget')
+
+            try:
+                response, content = send()
+            except (OSError, httplib2.HttpLib2Error):
+                self._record_failure()
+                # A write may have been applied before the connection broke, it is not repeated
+                if not read or attempt >= self.retries:
+                    snapshot = self._stale(uri) if read else None
+                    if snapshot is None:
+                        raise
+                    return snapshot, True
+                delay = self._backoff(attempt)
+            else:
+                if not _is_retryable(response.status):
+                    self._record_success()
+                    if read and response.status == 200:
+                        self._save_snapshot(uri, response, content)
+                    return (response, content), False
+
+                self._record_failure()
+                # 429 is rejected before processing, a write failed with 5xx may have been applied
+                if attempt >= self.retries or (not read and response.status != 429):
+                    snapshot = self._stale(uri) if read else None
+                    if snapshot is None:
+                        # googleapiclient raises HttpError of the response
+                        return (response, content), False
+                    return snapshot, True
+                delay = self._retry_after(response) or self._backoff(attempt)
+                if response.status == 429:
+                    # The quota is shared, hold the other requests as well
+                    bucket.pause(delay)
+
+            attempt += 1
+            GUARD_EVENTS.labels('retry').inc()
+            logger.warning('Sheets request failed, retry {} of {} in {:.1f}s'.format(attempt, self.retries, delay))
+            time.sleep(delay)
+
+    def _backoff(self, attempt):
+        """Exponential delay with full jitter, so the threads do not retry in step."""
+        return random.uniform(0, min(self.retry_delay * 2 ** attempt, self.max_retry_delay))
+
+    @staticmethod
+    def _retry_after(response):
+        try:
+            return float(response.get('retry-after', 0))
+        except (TypeError, ValueError):
+            return 0
+
+    def _allow(self):
+        """Whether a request can be sent, one probe request is let through once the cooldown is over."""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._probing or time.monotonic() - self._opened_at < self.cooldown:
+                return False
+            self._probing = True
+            return True
+
+    def _record_success(self):
+        with self._lock:
+            if self._opened_at is not None:
+                logger.info('Sheets API is available again, the circuit is closed')
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def _record_failure(self):
+        with self._lock:
+            self._failures += 1
+            probe_failed = self._probing
+            self._probing = False
+            if probe_failed or (self._opened_at is None and self._failures >= self.failure_threshold):
+                if not probe_failed:
+                    logger.warning('{} Sheets requests failed in a row, the circuit is open for {}s'.format(
+                        self._failures, self.cooldown))
+                self._opened_at = time.monotonic()
+
+    def _stale(self, uri):
+        """Snapshot of the read if the thread is within `stale_reads`, otherwise None."""
+        reads = getattr(self._thread, 'stale_reads', None)
+        if reads is None:
+            return None
+        with self._lock:
+            snapshot = self._snapshots.get(uri)
+        if snapshot is not None:
+            reads.served = True
+            GUARD_EVENTS.labels('snapshot').inc()
+        return snapshot
+
+    def _save_snapshot(self, uri, response, content):
+        with self._lock:
+            self._snapshots[uri] = (response, content)
+            self._snapshots.move_to_end(uri)
+            while len(self._snapshots) > self.snapshots:
+                self._snapshots.popitem(last=False)
+
+    def _degraded(self, uri, read, reason):
+        """Serve the snapshot of a read within `stale_reads` or reject the request."""
+        snapshot = self._stale(uri) if read else None
+        if snapshot is not None:
+            return snapshot, True
+        GUARD_EVENTS.labels('rejected').inc()
+        raise SheetsUnavailable('Sheets API is throttled: {}, try again later'.format(reason))
@@ -0,0 +1,111 @@
+"""Local state of the bot which has to survive restarts."""
+
+import logging
+import sqlite3
+
+from src.members import MemberRecord
+from src.utils import LOG_LEVEL, STATE_DB
+
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
+
+class RestrictionStore:
+
+    def __init__(self, path=STATE_DB):
+        """SQLite store of the restrictions applied in the groups.
+
+        :param path: str | Path  Database file.
+        """
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS restricted_users ('
+            'chat_id TEXT NOT NULL, '
+            'user_id INTEGER NOT NULL, '
+            'PRIMARY KEY (chat_id, user_id))'
+        )
+        self._conn.commit()
+
+    def load(self, chat_id) -> set:
+        """Return ids of the users restricted in the chat."""
+        rows = self._conn.execute('SELECT user_id FROM restricted_users WHERE chat_id = ?', (str(chat_id),))
+        user_ids = {user_id for user_id, in rows}
+        logger.info('{} restricted users loaded for chat {}.'.format(len(user_ids), chat_id))
+        return user_ids
+
+    def update(self, chat_id, restricted=(), unrestricted=()):
+        """Save the restrictions applied and lifted in the chat in one transaction."""
+        if not restricted and not unrestricted:
+            return
+
+        chat_id = str(chat_id)
+        with self._conn:
+            self._conn.executemany(
+                'INSERT OR IGNORE INTO restricted_users (chat_id, user_id) VALUES (?, ?)',
+                [(chat_id, user_id) for user_id in restricted]
+            )
+            self._conn.executemany(
+                'DELETE FROM restricted_users WHERE chat_id = ? AND user_id = ?',
+                [(chat_id, user_id) for user_id in unrestricted]
+            )
+
+    def close(self):
+        self._conn.close()
+
+
+class MemberHandoffStore:
+
+    def __init__(self, path=STATE_DB):
+        """SQLite queue of the new members passed by the worker processes to the leader.
+
+        :param path: str | Path  Database file, shared by the processes of the host.
+        """
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS pending_members ('
+            'chat_id TEXT NOT NULL, '
+            'user_id TEXT NOT NULL, '
+            'name TEXT NOT NULL, '
+            'username TEXT NOT NULL, '
+            'join_date TEXT NOT NULL, '
+            'PRIMARY KEY (chat_id, user_id))'
+        )
+        self._conn.commit()
+
+    def put(self, chat_id, records):
+        """Queue the members of the chat, the ones already queued are kept as they are."""
+        if not records:
+            return
+
+        chat_id = str(chat_id)
+        with self._conn:
+            self._conn.executemany(
+                'INSERT OR IGNORE INTO pending_members (chat_id, user_id, name, username, join_date) '
+                'VALUES (?, ?, ?, ?, ?)',
+                [(chat_id, record.id, record.name, record.username, record.join_date) for record in records]
+            )
+
+    def load(self, chat_id) -> list[MemberRecord]:
+        """Return the members of the chat queued by the workers, they stay queued until `delete`."""
+        rows = self._conn.execute(
+            'SELECT user_id, name, username, join_date FROM pending_members WHERE chat_id = ?', (str(chat_id),))
+        return [MemberRecord(0, user_id, name, username, join_date) for user_id, name, username, join_date in rows]
+
+    def delete(self, chat_id, user_ids):
+        """Remove the saved members from the queue."""
+        if not user_ids:
+            return
+
+        chat_id = str(chat_id)
+        with self._conn:
+            self._conn.executemany(
+                'DELETE FROM pending_members WHERE chat_id = ? AND user_id = ?',
+                [(chat_id, user_id) for user_id in user_ids]
+            )
+
+    def close(self):
+        self._conn.close()
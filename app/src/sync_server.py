@@ -0,0 +1,84 @@
+"""Endpoint applying the restrictions of the edited sheet rows right away.
+
+Example request:
+    POST /sync
+    X-Sync-Secret: <SYNC_SECRET>
+    {"spreadsheet_id": "...", "rows": [{"id": 123, "deposit": 0, "restricted": 1}]}
+
+`chat_id` can be sent instead of `spreadsheet_id`.
+"""
+
+import asyncio
+import hmac
+import logging
+
+from aiohttp import web
+
+from config import SYNC_HOST, SYNC_PORT, SYNC_PATH, SYNC_SECRET
+from src.groups import get_group, get_groups_by_spreadsheet
+from src.restricted import reconcilers
+from src.utils import LOG_LEVEL
+
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
+
+def _bad_request(reason):
+    return web.json_response({'error': reason}, status=400)
+
+
+async def handle_sync(request: web.Request):
+    if SYNC_SECRET and not hmac.compare_digest(request.headers.get('X-Sync-Secret', ''), SYNC_SECRET):
+        return web.json_response({'error': 'unauthorized'}, status=401)
+
+    try:
+        payload = await request.json()
+    except ValueError:
+        return _bad_request('invalid json')
+
+    rows = payload.get('rows') if isinstance(payload, dict) else None
+    if not isinstance(rows, list) or not rows:
+        return _bad_request('rows must be a non-empty list')
+    try:
+        rows = [row for row in rows if str(row.get('id', '')).strip()]
+        for row in rows:
+            int(row['id'])
+    except (AttributeError, TypeError, ValueError):
+        return _bad_request('every row must be an object with a numeric id')
+
+    if payload.get('chat_id') is not None:
+        group = get_group(payload['chat_id'])
+        groups = [group] if group is not None else []
+    else:
+        groups = get_groups_by_spreadsheet(payload.get('spreadsheet_id'))
+    if not groups:
+        return web.json_response({'error': 'unknown group'}, status=404)
+
+    bot = request.app['bot']
+    results = await asyncio.gather(*(reconcilers[group.chat_id].apply_rows(bot, rows) for group in groups))
+    logger.info('{} pushed rows applied to {} groups.'.format(len(rows), len(groups)))
+    return web.json_response({str(group.chat_id): result for group, result in zip(groups, results)})
+
+
+def create_sync_app(bot) -> web.Application:
+    """Build the app, it can be served or passed to the aiohttp test client."""
+    app = web.Application()
+    app['bot'] = bot
+    app.router.add_post(SYNC_PATH, handle_sync)
+    return app
+
+
+async def run_sync_server(bot, host=SYNC_HOST, port=SYNC_PORT):
+    if not SYNC_SECRET:
+        logger.warning('SYNC_SECRET is empty, the sync endpoint accepts any request.')
+
+    runner = web.AppRunner(create_sync_app(bot))
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    logger.info('Sync endpoint is listening on {}:{}{}'.format(host, port, SYNC_PATH))
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
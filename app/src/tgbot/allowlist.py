@@ -0,0 +1,124 @@
+"""In-memory list of the usernames allowed to use the admin commands."""
+
+import os
+import re
+import tempfile
+import time
+from pathlib import Path
+
+from src.utils import ALLOWLIST_CHECK_INTERVAL
+
+
+def _clean(username):
+    return username.strip().lstrip("@")
+
+
+def is_valid_username(username) -> bool:
+    """Whether the username (without @) or the user ID fits Telegram's ones and the callback data."""
+    return re.fullmatch(r"\w{1,32}", username, re.ASCII) is not None
+
+
+class Allowlist:
+
+    def __init__(self, path, check_interval=ALLOWLIST_CHECK_INTERVAL):
+        """Usernames file cached in memory.
+
+        The file is re-read only when its mtime changes, and the mtime is checked
+        at most once per `check_interval` seconds.
+
+        :param path: str | Path  Usernames file, one username per line.
+        :param check_interval: float  Seconds between the mtime checks.
+        """
+        self.path = Path(path)
+        self.check_interval = check_interval
+        # Incremented on every change of the usernames
+        self.version = 0
+        self._usernames = ()
+        self._lower = set()
+        self._mtime = None
+        self._checked_at = 0.0
+        self.reload()
+
+    def reload(self):
+        """Read the usernames file."""
+        try:
+            mtime = self.path.stat().st_mtime_ns
+            with open(self.path, "r", encoding="utf-8") as f:
+                usernames = [_clean(line) for line in f if line.strip()]
+        except FileNotFoundError:
+            mtime, usernames = None, []
+
+        self._set(usernames)
+        self._mtime = mtime
+        self._checked_at = time.monotonic()
+
+    def _set(self, usernames):
+        self._usernames = tuple(usernames)
+        self._lower = {username.lower() for username in usernames}
+        self.version += 1
+
+    def _refresh(self):
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        try:
+            mtime = self.path.stat().st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime != self._mtime:
+            self.reload()
+
+    def usernames(self) -> tuple[str, ...]:
+        """Return the usernames, the tuple is replaced on change, so it is not copied."""
+        self._refresh()
+        return self._usernames
+
+    def __contains__(self, username):
+        if not username:
+            return False
+        self._refresh()
+        return _clean(username).lower() in self._lower
+
+    def save(self, usernames):
+        """Replace the usernames, the file is swapped atomically."""
+        usernames = [_clean(username) for username in usernames if _clean(username)]
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.path.parent, prefix=self.path.name, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                for username in usernames:
+                    f.write(username + "\n")
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+        self._set(usernames)
+        self._mtime = self.path.stat().st_mtime_ns
+        self._checked_at = time.monotonic()
+
+    def add(self, usernames) -> int:
+        """Add the new valid usernames in lowercase, return the number of added ones."""
+        current = list(self.usernames())
+        known = set(self._lower)
+        for username in usernames:
+            username = _clean(username).lower()
+            if is_valid_username(username) and username not in known:
+                current.append(username)
+                known.add(username)
+
+        added = len(current) - len(self._usernames)
+        if added:
+            self.save(current)
+        return added
+
+    def remove(self, username) -> bool:
+        """Remove the username, return whether it was in the list."""
+        username = _clean(username).lower()
+        current = self.usernames()
+        remaining = [name for name in current if name.lower() != username]
+        if len(remaining) == len(current):
+            return False
+        self.save(remaining)
+        return True
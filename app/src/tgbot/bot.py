@@ -1,12 +1,77 @@
+import asyncio
 import logging
+
+from aiohttp import web
 from aiogram import Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
 
+from config import (
+    WEBHOOK_URL,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET,
+    WEBHOOK_HOST,
+    WEBHOOK_PORT,
+    WEBHOOK_MAX_CONNECTIONS,
+    METRICS_PORT,
+)
+from src.utils import LOG_LEVEL
 from .loader import bot
 from .handlers import register_handlers
+from .middlewares import HandlerMetricsMiddleware, TelegramMetricsMiddleware
+
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
+
+async def run_webhook(dp: Dispatcher):
+    """
+    Receive updates by webhook. Telegram gets 200 right away,
+    the handlers run in background tasks.
+    """
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        handle_in_background=True,
+        secret_token=WEBHOOK_SECRET or None,
+    ).register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    # Several worker processes listen on the port, the kernel spreads the connections
+    site = web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT, reuse_port=True)
+    await site.start()
+
+    await bot.set_webhook(
+        url=WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+        secret_token=WEBHOOK_SECRET or None,
+        max_connections=WEBHOOK_MAX_CONNECTIONS,
+        allowed_updates=dp.resolve_used_update_types(),
+    )
+    logger.info(f"Webhook is listening on {WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
 
+async def run_bot(metrics=bool(METRICS_PORT)):
+    """
+    Handle the updates, by webhook if WEBHOOK_URL is set or by long polling
 
-async def run_bot():
-    logging.basicConfig(level=logging.INFO)
+    :param metrics: bool  Whether to collect the handler and Telegram API metrics.
+    """
     dp = Dispatcher()
     register_handlers(dp)
-    await dp.start_polling(bot)
+    if metrics:
+        handler_metrics = HandlerMetricsMiddleware()
+        dp.message.middleware(handler_metrics)
+        dp.callback_query.middleware(handler_metrics)
+        bot.session.middleware(TelegramMetricsMiddleware())
+    if WEBHOOK_URL:
+        await run_webhook(dp)
+    else:
+        await bot.delete_webhook()
+        await dp.start_polling(bot)
@@ -0,0 +1,99 @@
+"""Callback data of the admin keyboards and the router dispatching the callback queries by it.
+
+Every callback query goes to one aiogram handler, which finds its handler
+with a dict lookup by the prefix of the data (and the action, if the data has
+one), so no filters are evaluated per query.
+"""
+
+import logging
+from enum import Enum
+
+from aiogram.filters.callback_data import CallbackData
+from aiogram.types import CallbackQuery
+
+from src.utils import LOG_LEVEL
+
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
+
+class MenuAction(str, Enum):
+    ADD_ADMINS = "add_admins"
+    DELETE_ADMIN = "delete_admin"
+    DELETE_MESSAGE = "delete_message"
+    RESTRICT_USER = "restrict_user"
+    CANCEL = "cancel"
+
+
+class MenuCallback(CallbackData, prefix="menu"):
+    action: MenuAction
+
+
+class AdminsPageCallback(CallbackData, prefix="admins_page"):
+    # Offset of the first username of the page
+    start: int
+
+
+class DeleteAdminAction(str, Enum):
+    CONFIRM = "confirm"
+    YES = "yes"
+    NO = "no"
+
+
+class DeleteAdminCallback(CallbackData, prefix="delete_admin"):
+    action: DeleteAdminAction
+    username: str
+
+
+class CallbackRouter:
+
+    def __init__(self):
+        """Callback query handlers indexed by the prefix and the action of their `CallbackData`."""
+        # (prefix, action value or None) -> (CallbackData class, handler)
+        self._routes = {}
+
+    def on(self, callback_data, action=None):
+        """Register the decorated handler of the callback data, of the given `action` only if set.
+
+        The handler is called with the query, the unpacked callback data and the FSM context.
+        """
+        key = (callback_data.__prefix__, action.value if action is not None else None)
+
+        def decorator(handler):
+            if key in self._routes:
+                raise ValueError("Callback {} is already routed".format(key))
+            self._routes[key] = (callback_data, handler)
+            return handler
+
+        return decorator
+
+    def _resolve(self, data):
+        prefix, _, rest = data.partition(":")
+        route = self._routes.get((prefix, rest.split(":", 1)[0]))
+        if route is None:
+            route = self._routes.get((prefix, None))
+        return route
+
+    def route_name(self, data):
+        """Name of the handler of the callback data, None if it is not routed."""
+        route = self._resolve(data or "")
+        return route[1].__name__ if route is not None else None
+
+    async def dispatch(self, callback: CallbackQuery, state):
+        """The only aiogram handler of the callback queries."""
+        route = self._resolve(callback.data or "")
+        if route is None:
+            # E.g. a button of a message sent before the callback data changed
+            logger.info("Unknown callback data: {}".format(callback.data))
+            await callback.answer("⚠️ This button is outdated, send /admin to open the panel again.",
+                                  show_alert=True)
+            return
+
+        callback_data, handler = route
+        try:
+            unpacked = callback_data.unpack(callback.data)
+        except (TypeError, ValueError):
+            logger.info("Invalid callback data: {}".format(callback.data))
+            await callback.answer()
+            return
+        return await handler(callback, unpacked, state)
@@ -0,0 +1,26 @@
+"""Message filters of the handlers.
+
+They are coroutines on purpose: aiogram runs the plain functions and the `F`
+magic filters in a thread, which costs a thread hop per filter on every
+group message.
+"""
+
+from aiogram.types import Message
+
+GROUP_CHAT_TYPES = {"group", "supergroup"}
+
+
+def text_startswith(prefix):
+    """Filter of the messages whose text starts with the prefix, e.g. a command."""
+    async def check(message: Message) -> bool:
+        return message.text is not None and message.text.startswith(prefix)
+
+    return check
+
+
+async def has_new_members(message: Message) -> bool:
+    return bool(message.new_chat_members)
+
+
+async def is_group_chat(message: Message) -> bool:
+    return message.chat.type in GROUP_CHAT_TYPES
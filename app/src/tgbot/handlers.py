@@ -1,45 +1,206 @@
+import html
 import re
+import asyncio
+import logging
 from pathlib import Path
 from functools import wraps
 
-from aiogram.types import Message, CallbackQuery, BotCommand
-from aiogram.filters import Command
-from aiogram import Dispatcher, F, types
+from datetime import datetime
+
+from aiogram.types import Message, CallbackQuery, BotCommand, BufferedInputFile
+from aiogram.filters import Command, CommandObject
+from aiogram import Dispatcher, types
+from aiogram.exceptions import TelegramRetryAfter
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
-from config import SPREADSHEET_ID, GROUP_CHAT_ID
-from src.google_spreadsheets import ServiceAccount
-from src.utils import SERVICE_ACCOUNT_CREDENTIALS, SCOPES
+from src.google_spreadsheets import get_service_account
+from src.groups import groups, get_group, default_group
+from src.leader import election
+from src.metrics import Gauge
+from src.registration import MemberRegistrationQueue
+from src.state import MemberHandoffStore
+from src.profiling import profiler
+from src.utils import (
+    LOG_LEVEL,
+    DELETE_BATCH_SIZE,
+    DELETE_CONCURRENCY,
+    DELETE_MAX_MESSAGES,
+    PROFILE_DEFAULT_SECONDS,
+    PROFILE_MAX_SECONDS,
+)
 from .loader import bot
-
+from .allowlist import Allowlist, is_valid_username
+
+from .callbacks import (
+    AdminsPageCallback,
+    CallbackRouter,
+    DeleteAdminAction,
+    DeleteAdminCallback,
+    MenuAction,
+    MenuCallback,
+)
+from .filters import has_new_members, is_group_chat, text_startswith
 from .keyboards import (
-    build_initial_admin_keyboard,
-    build_admin_list_keyboard,
+    INITIAL_ADMIN_KEYBOARD,
+    CANCEL_KEYBOARD,
+    AdminListKeyboards,
     build_confirm_delete_keyboard,
-    build_add_admin_prompt_keyboard,
 )
 
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
 ALLOWED_USERNAMES_PATH = Path(__file__).resolve().parents[2] / "data" / "allowed_usernames"
 
-sa = ServiceAccount(SERVICE_ACCOUNT_CREDENTIALS, SCOPES, 'sheets', 'v4')
+sa = get_service_account()
+# New members seen by the worker processes are saved by the leader
+handoff = MemberHandoffStore()
+# chat_id -> queue of the new members of the group
+registration_queues = {
+    chat_id: MemberRegistrationQueue(sa, group.spreadsheet_id, chat_id=chat_id, election=election, handoff=handoff)
+    for chat_id, group in groups.items()
+}
+allowlist = Allowlist(ALLOWED_USERNAMES_PATH)
+admin_list_keyboards = AdminListKeyboards()
+
+Gauge('registration_queue_members', 'New members waiting to be saved to the spreadsheet.', ['chat_id'],
+      function=lambda: {(str(chat_id),): queue.pending for chat_id, queue in registration_queues.items()})
 
 
-def load_allowed_usernames(path=ALLOWED_USERNAMES_PATH) -> list[str]:
-    with open(path, "r", encoding="utf-8") as f:
-        return [line.strip().lstrip("@") for line in f if line.strip()]
+def load_allowed_usernames() -> list[str]:
+    return list(allowlist.usernames())
 
 
 def save_usernames(usernames):
-    with open(ALLOWED_USERNAMES_PATH, "w", encoding="utf-8") as f:
-        for username in usernames:
-            f.write(username.strip().lstrip("@") + "\n")
+    allowlist.save(usernames)
 
 
 def is_allowed_user(username: str) -> bool:
-    if not username:
-        return False
-    return username.lstrip("@") in load_allowed_usernames()
+    return username in allowlist
+
+
+def parse_message_ids(text: str):
+    """Parse message IDs and ranges separated by spaces, commas or new lines.
+
+    Example: '1200-1450 1500' -> [1200, ..., 1450, 1500]
+    :return: list[int] | None  Sorted unique IDs or None if the text is invalid.
+    """
+    message_ids = set()
+    for token in re.split(r"[\s,]+", text.strip()):
+        if not token:
+            continue
+        match = re.fullmatch(r"(\d+)(?:-(\d+))?", token)
+        if not match:
+            return None
+        first = int(match.group(1))
+        last = int(match.group(2) or first)
+        if first > last:
+            first, last = last, first
+        if last - first >= DELETE_MAX_MESSAGES:
+            return None
+        message_ids.update(range(first, last + 1))
+    if not message_ids or len(message_ids) > DELETE_MAX_MESSAGES:
+        return None
+    return sorted(message_ids)
+
+
+def resolve_group(message: Message, text: str = ""):
+    """Return the group the admin command is meant for and the rest of the command text.
+
+    A command sent in a served group is for that group. In the private chat the group
+    can be given by its chat ID as the first argument, the default group is used otherwise.
+    :return: tuple[Group | None, str]
+    """
+    group = get_group(message.chat.id)
+    if group is not None:
+        return group, text
+
+    match = re.match(r"\s*(-\d+)(?:\s+|$)(.*)", text, re.DOTALL)
+    if match and get_group(match.group(1)) is not None:
+        return get_group(match.group(1)), match.group(2)
+    return default_group(), text
+
+
+async def delete_messages(message_ids, chat_id):
+    """Delete messages in batches of `DELETE_BATCH_SIZE` with bounded concurrency.
+
+    Telegram accepts a batch even if some of its messages can not be deleted
+    (already deleted or too old), so only the requested messages are known.
+
+    :return: tuple[int, int]  Number of the messages in the accepted batches and of the failed batches.
+    """
+    semaphore = asyncio.Semaphore(DELETE_CONCURRENCY)
+
+    async def delete_batch(batch):
+        async with semaphore:
+            for _ in range(3):
+                try:
+                    await bot.delete_messages(chat_id=chat_id, message_ids=batch)
+                    return True
+                except TelegramRetryAfter as e:
+                    await asyncio.sleep(e.retry_after)
+                except Exception as e:
+                    logger.error(f"Failed to delete messages {batch[0]}-{batch[-1]}: {e}", extra={"chat_id": chat_id})
+                    return False
+            return False
+
+    batches = [message_ids[i:i + DELETE_BATCH_SIZE] for i in range(0, len(message_ids), DELETE_BATCH_SIZE)]
+    results = await asyncio.gather(*(delete_batch(batch) for batch in batches))
+    requested = sum(len(batch) for batch, ok in zip(batches, results) if ok)
+    return requested, results.count(False)
+
+
+def parse_usernames(text: str) -> list[str]:
+    """Split usernames (or ids) separated by spaces or newlines, duplicates are dropped."""
+    usernames = {}
+    for name in text.split():
+        name = name.lstrip("@")
+        if name:
+            usernames.setdefault(name.lower(), name)
+    return list(usernames.values())
+
+
+RESTRICT_RESULTS = {
+    True: {
+        "changed": "✅ Marked as restricted",
+        "unchanged": "ℹ️ Already restricted",
+        "not_found": "⚠️ Not in the database",
+    },
+    False: {
+        "changed": "✅ Restriction removed",
+        "unchanged": "ℹ️ Not restricted",
+        "not_found": "⚠️ Not in the database",
+        "deposit": "⚠️ Positive deposit, stays restricted",
+    },
+}
+
+
+async def set_restricted_report(text: str, restricted: bool, group) -> str:
+    """Mark or unmark the users listed in the text in one sheet write and return the report."""
+    if group is None:
+        return "❗ No group is configured."
+
+    targets = parse_usernames(text)
+    invalid = [target for target in targets if not is_valid_username(target)]
+    if not targets or invalid:
+        return "❗ Please enter valid usernames or user IDs."
+
+    try:
+        if not election.is_leader:
+            # Only the leader saves the new members, pick up the ones it has saved
+            await sa.refresh_member_index(group.spreadsheet_id)
+        results = await sa.set_restricted(group.spreadsheet_id, targets, restricted)
+    except Exception as e:
+        return f"❌ Error restricting users: {e}"
+
+    by_result = {}
+    for target, result in results.items():
+        by_result.setdefault(result, []).append(target if target.isdigit() else f"@{target}")
+    return "\n".join(
+        f"{title}: {', '.join(by_result[result])}"
+        for result, title in RESTRICT_RESULTS[restricted].items() if result in by_result
+    )
 
 
 def admin_only(handler):
@@ -65,8 +226,11 @@ def register_handlers(dp: Dispatcher):
             "<b>Available commands:</b>\n\n"
             "/start — Start the bot communication\n"
             "/get_chatid — Get the chat ID (use command in the group chat!)\n"
-            "/delete — Delete a message\n"
-            "/restrict — Restrict a user from sending messages\n"
+            "/delete — Delete messages by IDs or ranges, e.g. /delete 1200-1450 1500\n"
+            "In the private chat the group ID can be given first, e.g. /delete -100123 1500\n"
+            "/restrict — Restrict users from sending messages, e.g. /restrict alice bob 12345\n"
+            "/unrestrict — Remove the restriction of users\n"
+            f"/profile — Profile the bot for N seconds (up to {PROFILE_MAX_SECONDS}), e.g. /profile 30\n"
         )
         await message.reply(help_text, parse_mode="HTML")
 
@@ -75,39 +239,78 @@ def register_handlers(dp: Dispatcher):
         chat_id = message.chat.id
         await message.reply(f"Group ID: {chat_id}")
 
-    @dp.message(F.text.startswith("/delete"))
+    @dp.message(text_startswith("/delete"))
     @admin_only
     async def delete_message_by_id(message: Message):
-        match = re.match(r"/delete\s+(\d+)", message.text)
-        if not match:
-            await message.reply("❗ Please enter the message ID, for example:\n<b>/delete 12345</b>", parse_mode="HTML")
+        match = re.match(r"/delete\S*\s+(.+)", message.text, re.DOTALL)
+        group, text = resolve_group(message, match.group(1) if match else "")
+        message_ids = parse_message_ids(text) if match else None
+        if group is None:
+            await message.reply("❗ No group is configured.")
             return
-        msg_id = int(match.group(1))
-        try:
-            await message.bot.delete_message(chat_id=GROUP_CHAT_ID, message_id=msg_id)
-            await message.reply(f"✅ Message {msg_id} removed from group.")
-        except Exception as e:
-            await message.reply(f"❌ Failed to delete message: {e}")
+        if not message_ids:
+            await message.reply(
+                "❗ Please enter message IDs or ranges, for example:\n"
+                "<b>/delete 12345</b> or <b>/delete 1200-1450 1500</b>\n"
+                f"Up to {DELETE_MAX_MESSAGES} messages at once.",
+                parse_mode="HTML"
+            )
+            return
+        requested, failed_batches = await delete_messages(message_ids, group.chat_id)
+        await message.reply(f"✅ Deletion requested for {requested} messages, failed batches: {failed_batches}.")
 
-    @dp.message(F.text.startswith("/restrict"))
+    @dp.message(text_startswith("/restrict"))
     @admin_only
     async def restrict_user_by_username(message: types.Message):
 
-        match = re.match(r"/restrict\s+(@?\w+)", message.text)
+        match = re.match(r"/restrict\S*\s+(.+)", message.text, re.DOTALL)
         if not match:
-            await message.reply("❗ Please enter the username, for example:\n<b>/restrict alice123</b>",
+            await message.reply("❗ Please enter the usernames, for example:\n<b>/restrict alice123 bob</b>",
                                 parse_mode="HTML")
             return
 
-        target_username = match.group(1).lstrip("@")
+        group, text = resolve_group(message, match.group(1))
+        await message.reply(await set_restricted_report(text, restricted=True, group=group))
+
+    @dp.message(text_startswith("/unrestrict"))
+    @admin_only
+    async def unrestrict_user_by_username(message: types.Message):
+
+        match = re.match(r"/unrestrict\S*\s+(.+)", message.text, re.DOTALL)
+        if not match:
+            await message.reply("❗ Please enter the usernames, for example:\n<b>/unrestrict alice123 bob</b>",
+                                parse_mode="HTML")
+            return
+
+        group, text = resolve_group(message, match.group(1))
+        await message.reply(await set_restricted_report(text, restricted=False, group=group))
+
+    @dp.message(Command("profile"))
+    @admin_only
+    async def profile_bot(message: Message, command: CommandObject):
+        try:
+            seconds = float(command.args) if command.args else PROFILE_DEFAULT_SECONDS
+        except ValueError:
+            await message.reply("❗ Please enter the number of seconds, for example:\n<b>/profile 30</b>",
+                                parse_mode="HTML")
+            return
+        if not 1 <= seconds <= PROFILE_MAX_SECONDS:
+            await message.reply(f"❗ Profiling can last from 1 to {PROFILE_MAX_SECONDS} seconds.")
+            return
+        if profiler.running:
+            await message.reply("⏳ Profiling is already running.")
+            return
 
+        await message.reply(f"⏱ Profiling for {seconds:g} s...")
         try:
-            sa.restrict_user(SPREADSHEET_ID, target_username)
-            await message.reply(f"✅ User @{target_username} is marked as restricted.")
-        except ValueError as ve:
-            await message.reply(f"⚠️ {ve}")
-        except Exception as e:
-            await message.reply(f"❌ Error restricting user: {e}")
+            # The sampling thread reads the stacks of the loop thread while it keeps working
+            report = await asyncio.to_thread(profiler.sample, seconds)
+        except RuntimeError:
+            await message.reply("⏳ Profiling is already running.")
+            return
+        filename = datetime.now().strftime("profile-%Y%m%d-%H%M%S.txt")
+        await message.reply_document(BufferedInputFile(report.encode(), filename=filename),
+                                     caption="📊 Hottest functions by thread and folded stacks.")
 
     class AddAdmins(StatesGroup):
         waiting_for_usernames = State()
@@ -117,120 +320,97 @@ def register_handlers(dp: Dispatcher):
     async def start_command_handler(message: Message):
         await message.answer(
             "👋 Hello! Welcome to the bot.\nClick the button below to open the admin panel.",
-            reply_markup=build_initial_admin_keyboard()
+            reply_markup=INITIAL_ADMIN_KEYBOARD
         )
         await bot.set_my_commands([
             BotCommand(command="start", description="Start the bot communication"),
             BotCommand(command="help", description="Get commands"),
             BotCommand(command="get_chatid", description="Get the chat ID (use command in the group chat!)"),
-            BotCommand(command="delete", description="Delete a message"),
-            BotCommand(command="restrict", description="Restrict a user from sending messages"),
+            BotCommand(command="delete", description="Delete messages by IDs or ranges"),
+            BotCommand(command="restrict", description="Restrict users from sending messages"),
+            BotCommand(command="unrestrict", description="Remove the restriction of users"),
+            BotCommand(command="profile", description="Profile the bot for N seconds"),
         ])
 
     @dp.message(Command("admin"))
     @admin_only
     async def admin_panel(message: Message):
-        await message.reply("🔧 Admin panel:", reply_markup=build_initial_admin_keyboard())
+        await message.reply("🔧 Admin panel:", reply_markup=INITIAL_ADMIN_KEYBOARD)
 
-    @dp.callback_query(F.data == "add_admins_prompt")
-    @admin_only
-    async def prompt_add_admins(callback: CallbackQuery, state: FSMContext):
+    # All the callback queries are admin actions, they are dispatched by their data
+    callbacks = CallbackRouter()
+    dp.callback_query.register(admin_only(callbacks.dispatch))
+    # Passed to the middlewares, the metrics are labelled by the routed handler
+    dp["callback_router"] = callbacks
+
+    @callbacks.on(MenuCallback, MenuAction.ADD_ADMINS)
+    async def prompt_add_admins(callback: CallbackQuery, callback_data: MenuCallback, state: FSMContext):
         await callback.message.edit_text(
             "✏️ Enter usernames to add (one per line or separated by spaces):",
-            reply_markup=build_add_admin_prompt_keyboard()
+            reply_markup=CANCEL_KEYBOARD
         )
         await state.set_state(AddAdmins.waiting_for_usernames)
         await callback.answer()
 
     @dp.message(AddAdmins.waiting_for_usernames)
     async def process_add_admins_input(message: Message, state: FSMContext):
-        input_text = message.text
-
-        new_usernames_raw = [line.strip().lstrip("@") for line in input_text.splitlines()] if "\n" in input_text \
-            else [name.strip().lstrip("@") for name in input_text.split()]
-        new_usernames = [name for name in new_usernames_raw if name]
+        new_usernames = parse_usernames(message.text or "")
+        invalid = [username for username in new_usernames if not is_valid_username(username)]
 
-        existing_usernames = load_allowed_usernames()
-        existing_usernames_lower = {u.lower() for u in existing_usernames}
+        added_count = allowlist.add(new_usernames)
 
-        added_count = 0
-        with open(ALLOWED_USERNAMES_PATH, "a", encoding="utf-8") as f:
-            for username in new_usernames:
-                if username.lower() not in existing_usernames_lower:
-                    f.write(username.lower() + "\n")
-                    added_count += 1
-
-        await message.answer(f"✅ {added_count} admins added.", reply_markup=build_initial_admin_keyboard())
+        text = f"✅ {added_count} admins added."
+        if invalid:
+            text += f"\n⚠️ Invalid usernames skipped: {html.escape(', '.join(invalid))}"
+        await message.answer(text, reply_markup=INITIAL_ADMIN_KEYBOARD)
         await state.clear()
 
     # delete admin username
-    @dp.callback_query(F.data == "delete_admin_start")
-    @admin_only
-    async def show_admins_to_delete(callback: CallbackQuery):
+    @callbacks.on(MenuCallback, MenuAction.DELETE_ADMIN)
+    async def show_admins_to_delete(callback: CallbackQuery, callback_data: MenuCallback, state: FSMContext):
 
-        usernames = list(load_allowed_usernames())
+        keyboard = admin_list_keyboards.page(allowlist)
 
-        if not usernames:
-            await callback.message.edit_text("❗ No admins to delete.", reply_markup=build_initial_admin_keyboard())
+        if keyboard is None:
+            await callback.message.edit_text("❗ No admins to delete.", reply_markup=INITIAL_ADMIN_KEYBOARD)
             return
 
-        await callback.message.edit_text(
-            "🗑️ Select admin to delete:",
-            reply_markup=build_admin_list_keyboard(usernames)
-        )
-        await callback.answer()
-
-    @dp.callback_query(F.data.startswith("next_page:"))
-    @admin_only
-    async def next_admins_page(callback: CallbackQuery):
-        offset = int(callback.data.split(":")[1])
-        usernames = list(load_allowed_usernames())
-        await callback.message.edit_text("🗑️ Select admin to delete:",
-                                         reply_markup=build_admin_list_keyboard(usernames, start=offset))
+        await callback.message.edit_text("🗑️ Select admin to delete:", reply_markup=keyboard)
         await callback.answer()
 
-    @dp.callback_query(F.data.startswith("prev_page:"))
-    @admin_only
-    async def previous_admins_page(callback: CallbackQuery):
+    @callbacks.on(AdminsPageCallback)
+    async def show_admins_page(callback: CallbackQuery, callback_data: AdminsPageCallback, state: FSMContext):
+        keyboard = admin_list_keyboards.page(allowlist, start=callback_data.start)
+        if keyboard is None:
+            await callback.message.edit_text("❗ No admins to delete.", reply_markup=INITIAL_ADMIN_KEYBOARD)
+            return
 
-        offset = int(callback.data.split(":")[1])
-        usernames = list(load_allowed_usernames())
-        await callback.message.edit_text(
-            "🗑️ Select admin to delete:",
-            reply_markup=build_admin_list_keyboard(usernames, start=offset)
-        )
+        await callback.message.edit_text("🗑️ Select admin to delete:", reply_markup=keyboard)
         await callback.answer()
 
-    @dp.callback_query(F.data.startswith("confirm_delete:"))
-    @admin_only
-    async def confirm_delete(callback: CallbackQuery):
-        username = callback.data.split(":")[1]
+    @callbacks.on(DeleteAdminCallback, DeleteAdminAction.CONFIRM)
+    async def confirm_delete(callback: CallbackQuery, callback_data: DeleteAdminCallback, state: FSMContext):
+        username = callback_data.username
         await callback.message.edit_text(f"❔ Delete {username}?", reply_markup=build_confirm_delete_keyboard(username))
         await callback.answer()
 
-    @dp.callback_query(F.data.startswith("delete_confirm_yes:"))
-    @admin_only
-    async def delete_admin(callback: CallbackQuery):
-        username = callback.data.split(":")[1]
-        usernames = list(load_allowed_usernames())
-        if username in usernames:
-            usernames.remove(username)
-            save_usernames(usernames)
-            await callback.message.edit_text(f"✅ @{username} removed.", reply_markup=build_initial_admin_keyboard())
+    @callbacks.on(DeleteAdminCallback, DeleteAdminAction.YES)
+    async def delete_admin(callback: CallbackQuery, callback_data: DeleteAdminCallback, state: FSMContext):
+        username = callback_data.username
+        if allowlist.remove(username):
+            await callback.message.edit_text(f"✅ @{username} removed.", reply_markup=INITIAL_ADMIN_KEYBOARD)
         else:
-            await callback.message.edit_text("⚠️ Username not found.", reply_markup=build_initial_admin_keyboard())
+            await callback.message.edit_text("⚠️ Username not found.", reply_markup=INITIAL_ADMIN_KEYBOARD)
         await callback.answer()
 
-    @dp.callback_query(F.data.startswith("delete_confirm_no:"))
-    @admin_only
-    async def cancel_delete_admin(callback: CallbackQuery):
-        await callback.message.edit_text("❌ Deletion cancelled.", reply_markup=build_initial_admin_keyboard())
+    @callbacks.on(DeleteAdminCallback, DeleteAdminAction.NO)
+    async def cancel_delete_admin(callback: CallbackQuery, callback_data: DeleteAdminCallback, state: FSMContext):
+        await callback.message.edit_text("❌ Deletion cancelled.", reply_markup=INITIAL_ADMIN_KEYBOARD)
         await callback.answer()
 
-    @dp.callback_query(F.data == "cancel_admin_action")
-    @admin_only
-    async def cancel_action(callback: CallbackQuery, state: FSMContext):
-        await callback.message.edit_text("🔙 Action cancelled.", reply_markup=build_initial_admin_keyboard())
+    @callbacks.on(MenuCallback, MenuAction.CANCEL)
+    async def cancel_action(callback: CallbackQuery, callback_data: MenuCallback, state: FSMContext):
+        await callback.message.edit_text("🔙 Action cancelled.", reply_markup=INITIAL_ADMIN_KEYBOARD)
         await state.clear()
         await callback.answer()
 
@@ -239,12 +419,11 @@ def register_handlers(dp: Dispatcher):
         waiting_for_restrict_username = State()
 
     # delete message
-    @dp.callback_query(F.data == "delete_message_prompt")
-    @admin_only
-    async def prompt_delete_message(callback: CallbackQuery, state: FSMContext):
+    @callbacks.on(MenuCallback, MenuAction.DELETE_MESSAGE)
+    async def prompt_delete_message(callback: CallbackQuery, callback_data: MenuCallback, state: FSMContext):
         await callback.message.edit_text(
-            "🆔 Enter the message ID you want to delete:",
-            reply_markup=build_add_admin_prompt_keyboard()
+            "🆔 Enter the message IDs or ranges you want to delete, e.g. 1200-1450 1500:",
+            reply_markup=CANCEL_KEYBOARD
         )
         await state.set_state(MessageActions.waiting_for_message_id)
         await callback.answer()
@@ -253,26 +432,27 @@ def register_handlers(dp: Dispatcher):
     @admin_only
     async def process_delete_message_id(message: Message, state: FSMContext):
 
-        match = re.match(r"^\d+$", message.text.strip())
-        if not match:
-            await message.reply("❗ Please enter a valid numeric message ID.")
+        group, text = resolve_group(message, message.text or "")
+        if group is None:
+            await message.reply("❗ No group is configured.", reply_markup=INITIAL_ADMIN_KEYBOARD)
+            await state.clear()
+            return
+        message_ids = parse_message_ids(text)
+        if not message_ids:
+            await message.reply(f"❗ Please enter valid numeric message IDs or ranges, up to {DELETE_MAX_MESSAGES}.")
             return
 
-        msg_id = int(message.text.strip())
-        try:
-            await message.bot.delete_message(chat_id=GROUP_CHAT_ID, message_id=msg_id)
-            await message.reply(f"✅ Message {msg_id} removed from group.", reply_markup=build_initial_admin_keyboard())
-        except Exception as e:
-            await message.reply(f"❌ Failed to delete message: {e}", reply_markup=build_initial_admin_keyboard())
+        requested, failed_batches = await delete_messages(message_ids, group.chat_id)
+        await message.reply(f"✅ Deletion requested for {requested} messages, failed batches: {failed_batches}.",
+                            reply_markup=INITIAL_ADMIN_KEYBOARD)
         await state.clear()
 
     # restrict users
-    @dp.callback_query(F.data == "restrict_user_prompt")
-    @admin_only
-    async def prompt_restrict_user(callback: CallbackQuery, state: FSMContext):
+    @callbacks.on(MenuCallback, MenuAction.RESTRICT_USER)
+    async def prompt_restrict_user(callback: CallbackQuery, callback_data: MenuCallback, state: FSMContext):
         await callback.message.edit_text(
-            "✏️ Enter the username to restrict (without @):",
-            reply_markup=build_add_admin_prompt_keyboard()
+            "✏️ Enter the usernames or user IDs to restrict (one per line or separated by spaces):",
+            reply_markup=CANCEL_KEYBOARD
         )
         await state.set_state(MessageActions.waiting_for_restrict_username)
         await callback.answer()
@@ -281,41 +461,35 @@ def register_handlers(dp: Dispatcher):
     @admin_only
     async def process_restrict_username(message: Message, state: FSMContext):
 
-        target_username = message.text.strip().lstrip("@")
-        if not target_username.isalnum():
-            await message.reply("❗ Please enter a valid username.")
+        group, text = resolve_group(message, message.text or "")
+        report = await set_restricted_report(text, restricted=True, group=group)
+        if report.startswith("❗"):
+            await message.reply(report)
             return
 
-        try:
-            sa.restrict_user(SPREADSHEET_ID, target_username)
-            await message.reply(f"✅ User @{target_username} is marked as restricted.",
-                                reply_markup=build_initial_admin_keyboard())
-        except ValueError as ve:
-            await message.reply(f"⚠️ {ve}", reply_markup=build_initial_admin_keyboard())
-        except Exception as e:
-            await message.reply(f"❌ Error restricting user: {e}", reply_markup=build_initial_admin_keyboard())
+        await message.reply(report, reply_markup=INITIAL_ADMIN_KEYBOARD)
         await state.clear()
 
     # save new group members
-    @dp.message(F.new_chat_members)
+    @dp.message(has_new_members)
     async def new_members_handler(message: Message):
+        registration_queue = registration_queues.get(message.chat.id)
+        if registration_queue is None:
+            return
         for user in message.new_chat_members:
-            user_data = {
-                "id": user.id,
-                "name": user.full_name,
-                "username": user.username
-            }
-            sa.save_user_to_sheets(SPREADSHEET_ID, user_data)
-            print(f"🟢 New group member: {user.full_name} (ID: {user.id}, username: @{user.username})")
+            registration_queue.register(user.id, user.full_name, user.username)
+            # Lazy arguments, the message is rendered only for the sampled records
+            logger.info("New group member: %s (ID: %s, username: @%s)", user.full_name, user.id, user.username,
+                        extra={"event": "new_member", "chat_id": message.chat.id, "user_id": user.id})
 
     # save user by message in group
-    @dp.message(F.chat.type.in_({"group", "supergroup"}))
+    @dp.message(is_group_chat)
     async def group_message_handler(message: Message):
+        registration_queue = registration_queues.get(message.chat.id)
+        if registration_queue is None:
+            return
         user = message.from_user
-        user_data = {
-            "id": user.id,
-            "name": user.full_name,
-            "username": user.username
-        }
-        sa.save_user_to_sheets(SPREADSHEET_ID, user_data)
-        print(f"💬 Message in group from {user.full_name} (ID: {user.id}): {message.text}")
+        registration_queue.register(user.id, user.full_name, user.username)
+        logger.info("Message in group from %s (ID: %s): %s", user.full_name, user.id, message.text,
+                    extra={"event": "group_message", "chat_id": message.chat.id, "user_id": user.id,
+                           "message_id": message.message_id})
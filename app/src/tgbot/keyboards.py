@@ -1,67 +1,125 @@
+import functools
+
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 
+from src.utils import ADMINS_PER_PAGE
+from .callbacks import (
+    AdminsPageCallback,
+    DeleteAdminAction,
+    DeleteAdminCallback,
+    MenuAction,
+    MenuCallback,
+)
+
+# The keyboards are not changed once built, so they are shared by all the messages
 
 # Original keyboard
-def build_initial_admin_keyboard():
-    return InlineKeyboardMarkup(
-        inline_keyboard=[
-            [InlineKeyboardButton(text="➕ Add admins", callback_data="add_admins_prompt")],
-            [InlineKeyboardButton(text="🗑️ Delete admin", callback_data="delete_admin_start")],
-            [InlineKeyboardButton(text="🗑️ Delete message by ID", callback_data="delete_message_prompt")],
-            [InlineKeyboardButton(text="🚫 Restrict user", callback_data="restrict_user_prompt")]
-        ]
-    )
+INITIAL_ADMIN_KEYBOARD = InlineKeyboardMarkup(
+    inline_keyboard=[
+        [InlineKeyboardButton(text="➕ Add admins", callback_data=MenuCallback(action=MenuAction.ADD_ADMINS).pack())],
+        [InlineKeyboardButton(text="🗑️ Delete admin",
+                              callback_data=MenuCallback(action=MenuAction.DELETE_ADMIN).pack())],
+        [InlineKeyboardButton(text="🗑️ Delete message by ID",
+                              callback_data=MenuCallback(action=MenuAction.DELETE_MESSAGE).pack())],
+        [InlineKeyboardButton(text="🚫 Restrict user",
+                              callback_data=MenuCallback(action=MenuAction.RESTRICT_USER).pack())]
+    ]
+)
+
+CANCEL_BUTTON = InlineKeyboardButton(text="🔙 Cancel", callback_data=MenuCallback(action=MenuAction.CANCEL).pack())
 
+# Keyboard when adding
+CANCEL_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[[CANCEL_BUTTON]])
 
-# Keyboard with users to delete
-def build_admin_list_keyboard(usernames, start=0, per_page=5):
-    usernames = usernames[::-1]
-    total = len(usernames)
-    page_usernames = usernames[start:start + per_page]
 
-    keyboard_buttons = []
+class AdminListKeyboards:
 
-    # Button with admin usernames
-    for username in page_usernames:
-        keyboard_buttons.append([
-            InlineKeyboardButton(text=f"@{username}", callback_data=f"confirm_delete:{username}")
-        ])
+    def __init__(self, per_page=ADMINS_PER_PAGE):
+        """Pages of the keyboard with the admins to delete.
+
+        A page is built on the first request and kept until the allowlist changes.
+
+        :param per_page: int  Usernames per page.
+        """
+        self.per_page = per_page
+        self._allowlist = None
+        self._version = None
+        # start -> keyboard
+        self._pages = {}
+
+    def page(self, allowlist, start=0):
+        """Return the keyboard of the page starting from the `start` username, the latest added first.
+
+        :param allowlist: Allowlist  Admin usernames.
+        :param start: int  Offset of the first username of the page.
+        :return: InlineKeyboardMarkup | None  None if there are no admins.
+        """
+        usernames = allowlist.usernames()
+        if allowlist is not self._allowlist or allowlist.version != self._version:
+            self._allowlist, self._version, self._pages = allowlist, allowlist.version, {}
 
-    # Navigation buttons
-    nav_buttons = []
-    if start >= per_page:
-        nav_buttons.append(InlineKeyboardButton(text="⬅️ Previous", callback_data=f"prev_page:{start - per_page}"))
-    if total > start + per_page:
-        nav_buttons.append(InlineKeyboardButton(text="➡️ Next", callback_data=f"next_page:{start + per_page}"))
+        total = len(usernames)
+        if not total:
+            return None
+        # A page beyond the end after a deletion shows the last one
+        start = max(0, min(start, (total - 1) // self.per_page * self.per_page))
 
-    if nav_buttons:
-        keyboard_buttons.append(nav_buttons)
+        keyboard = self._pages.get(start)
+        if keyboard is None:
+            keyboard = self._pages[start] = self._build(usernames, start, total)
+        return keyboard
 
-    # Cancel button
-    keyboard_buttons.append([
-        InlineKeyboardButton(text="❌ Cancel", callback_data="cancel_admin_action")
-    ])
+    def _build(self, usernames, start, total):
+        # The page of the reversed list, without reversing the whole list
+        end = total - start
+        page_usernames = usernames[max(0, end - self.per_page):end][::-1]
 
-    return InlineKeyboardMarkup(inline_keyboard=keyboard_buttons)
+        keyboard_buttons = []
+
+        # Button with admin usernames
+        for username in page_usernames:
+            try:
+                callback_data = DeleteAdminCallback(action=DeleteAdminAction.CONFIRM, username=username).pack()
+            except ValueError:
+                # An invalid username added to the file by hand, it does not fit the callback data
+                continue
+            keyboard_buttons.append([InlineKeyboardButton(text=f"@{username}", callback_data=callback_data)])
+
+        # Navigation buttons
+        nav_buttons = []
+        if start >= self.per_page:
+            nav_buttons.append(InlineKeyboardButton(
+                text="⬅️ Previous", callback_data=AdminsPageCallback(start=start - self.per_page).pack()))
+        if total > start + self.per_page:
+            nav_buttons.append(InlineKeyboardButton(
+                text="➡️ Next", callback_data=AdminsPageCallback(start=start + self.per_page).pack()))
+
+        if nav_buttons:
+            keyboard_buttons.append(nav_buttons)
+
+        # Cancel button
+        keyboard_buttons.append([
+            InlineKeyboardButton(text="❌ Cancel", callback_data=MenuCallback(action=MenuAction.CANCEL).pack())
+        ])
+
+        return InlineKeyboardMarkup(inline_keyboard=keyboard_buttons)
 
 
 # Confirm deletion
+@functools.lru_cache(maxsize=128)
 def build_confirm_delete_keyboard(username):
     return InlineKeyboardMarkup(
         inline_keyboard=[
             [
-                InlineKeyboardButton(text="✅ Yes", callback_data=f"delete_confirm_yes:{username}"),
-                InlineKeyboardButton(text="❌ No", callback_data=f"delete_confirm_no:{username}")
+                InlineKeyboardButton(
+                    text="✅ Yes",
+                    callback_data=DeleteAdminCallback(action=DeleteAdminAction.YES, username=username).pack()
+                ),
+                InlineKeyboardButton(
+                    text="❌ No",
+                    callback_data=DeleteAdminCallback(action=DeleteAdminAction.NO, username=username).pack()
+                )
             ],
-            [InlineKeyboardButton(text="🔙 Cancel", callback_data="cancel_admin_action")]
-        ]
-    )
-
-
-# Keyboard when adding
-def build_add_admin_prompt_keyboard():
-    return InlineKeyboardMarkup(
-        inline_keyboard=[
-            [InlineKeyboardButton(text="🔙 Cancel", callback_data="cancel_admin_action")]
+            [CANCEL_BUTTON]
         ]
     )
@@ -0,0 +1,61 @@
+"""Middlewares collecting the metrics of the updates and the Telegram API calls."""
+
+import time
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramAPIError, TelegramRetryAfter
+from aiogram.types import CallbackQuery
+
+from src.metrics import Counter, Histogram
+
+HANDLER_DURATION = Histogram('handler_duration_seconds', 'Time spent in the update handlers.', ['handler'])
+HANDLER_ERRORS = Counter('handler_errors_total', 'Exceptions raised by the update handlers.', ['handler'])
+TELEGRAM_REQUESTS = Counter('telegram_requests_total', 'Telegram API requests.', ['method', 'result'])
+TELEGRAM_REQUEST_DURATION = Histogram('telegram_request_duration_seconds', 'Telegram API request duration.',
+                                      ['method'])
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Inner middleware timing every handler, registered on the message and callback query observers.
+
+    Callback queries are labelled by the handler their data is routed to by the `callback_router`.
+    """
+
+    async def __call__(self, handler, event, data):
+        name = data['handler'].callback.__name__
+        router = data.get('callback_router')
+        if router is not None and isinstance(event, CallbackQuery):
+            name = router.route_name(event.data) or name
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.labels(name).inc()
+            raise
+        finally:
+            HANDLER_DURATION.labels(name).observe(time.perf_counter() - start)
+
+
+class TelegramMetricsMiddleware(BaseRequestMiddleware):
+    """Session middleware counting the Telegram API calls, flood control (429) errors are counted apart."""
+
+    async def __call__(self, make_request, bot, method):
+        name = method.__api_method__
+        start = time.perf_counter()
+        try:
+            response = await make_request(bot, method)
+        except TelegramRetryAfter:
+            TELEGRAM_REQUESTS.labels(name, '429').inc()
+            raise
+        except TelegramAPIError:
+            TELEGRAM_REQUESTS.labels(name, 'error').inc()
+            raise
+        except Exception:
+            TELEGRAM_REQUESTS.labels(name, 'network_error').inc()
+            raise
+        finally:
+            TELEGRAM_REQUEST_DURATION.labels(name).observe(time.perf_counter() - start)
+
+        TELEGRAM_REQUESTS.labels(name, 'ok').inc()
+        return response
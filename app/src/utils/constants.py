@@ -13,6 +13,14 @@ TEMP_DIR = BASE_DIR.joinpath('temp').absolute().resolve()
 LOG_DIR = TEMP_DIR.joinpath('logs/').absolute().resolve()
 LOG_FMT = '%(asctime)s [%(levelname)s]: %(name)s: %(message)s'
 LOG_LEVEL = logging.INFO
+# Records are written as JSON objects, one per line
+LOG_JSON = True
+# Records waiting for the output, new ones are dropped when it is full
+LOG_QUEUE_SIZE = 10000
+# Only one of every N records of the high-volume events is kept
+LOG_SAMPLE_EVERY = 100
+LOG_SAMPLED_EVENTS = {'group_message', 'new_member'}
+LOG_SAMPLED_LOGGERS = {'aiogram.event'}
 
 # Update logs time
 # @link: https://docs.python.org/3/library/logging.handlers.html#timedrotatingfilehandler
@@ -23,6 +31,96 @@ KEEP_OLD_LOGS = 5
 # [Google API]
 SERVICE_ACCOUNT_CREDENTIALS = DATA_DIR.joinpath('credentials.json')
 SCOPES = ['https://www.googleapis.com/auth/spreadsheets']
+# Max number of the Sheets requests running at the same time
+SHEETS_MAX_WORKERS = 4
+# The access token is refreshed in the background that many seconds before it expires
+TOKEN_REFRESH_MARGIN = 300
+# Budget of the Sheets requests, Google allows 60 reads and 60 writes per minute per service account
+# by default. Up to SHEETS_QUOTA_BURST requests can be sent at once
+SHEETS_READS_PER_MINUTE = 50
+SHEETS_WRITES_PER_MINUTE = 50
+SHEETS_QUOTA_BURST = 10
+# Max seconds a request waits for the budget, then it fails or a read is served from its snapshot
+SHEETS_QUOTA_MAX_WAIT = 20
+# Retries of the requests failed with 429 or 5xx, the delay doubles from SHEETS_RETRY_DELAY
+# up to SHEETS_MAX_RETRY_DELAY seconds with a random jitter
+SHEETS_RETRIES = 4
+SHEETS_RETRY_DELAY = 1
+SHEETS_MAX_RETRY_DELAY = 32
+# After N failed requests in a row the API is not called for SHEETS_BREAKER_COOLDOWN seconds,
+# reads are served from the last good responses meanwhile
+SHEETS_BREAKER_THRESHOLD = 5
+SHEETS_BREAKER_COOLDOWN = 30
+# Number of the last good read responses kept for that
+SHEETS_SNAPSHOTS = 32
+
+# [Admins]
+# Seconds between the checks of the allowed usernames file modification
+ALLOWLIST_CHECK_INTERVAL = 5
+# Usernames per page of the admin list keyboard
+ADMINS_PER_PAGE = 5
+
+# [Messages deletion]
+# Telegram deletes up to 100 messages per request
+DELETE_BATCH_SIZE = 100
+DELETE_CONCURRENCY = 5
+DELETE_MAX_MESSAGES = 5000
+
+# [Members registration]
+# New members are appended to the spreadsheet every N seconds or as soon as M of them are queued
+REGISTRATION_FLUSH_INTERVAL = 10
+REGISTRATION_FLUSH_SIZE = 100
+
+# [Restrictions]
+# Max number of the restrict requests in flight and per second
+RESTRICT_CONCURRENCY = 10
+RESTRICT_RATE = 20
+# Retries of a request hitting the flood control
+RESTRICT_FLOOD_RETRIES = 3
+# Backoff of the failed users, seconds
+RESTRICT_RETRY_DELAY = 5
+RESTRICT_MAX_RETRY_DELAY = 600
+
+# Applied restrictions survive restarts in the local database
+STATE_DB = DATA_DIR.joinpath('state.sqlite3')
+# Check the stored restrictions against the group on startup, users per batch
+RESTRICT_AUDIT_ON_STARTUP = False
+RESTRICT_AUDIT_BATCH = 50
+
+# [Workers]
+# The jobs of the leader process (sheet checks, members registration, the sync endpoint)
+# are taken over by another process once its lease is not renewed for LEADER_LEASE_TTL seconds
+LEADER_LEASE_TTL = 15
+LEADER_RENEW_INTERVAL = 5
+# 'all' handles the updates and runs the jobs when elected, 'bot' only handles the updates,
+# 'jobs' only runs the jobs when elected
+WORKER_ROLES = ('all', 'bot', 'jobs')
+
+# [Polling]
+# The sheet is polled every POLL_MIN_INTERVAL seconds after a change,
+# the interval grows by POLL_BACKOFF up to POLL_MAX_INTERVAL while nothing changes
+POLL_MIN_INTERVAL = 2
+POLL_MAX_INTERVAL = 30
+POLL_BACKOFF = 1.5
+# With SHEET_CHECKSUM_CELL the columns are read at least that often even if the checksum did not change
+POLL_FULL_CHECK_INTERVAL = 300
+# With the sync endpoint enabled polling is a safety net and starts from this interval
+SYNC_POLL_MIN_INTERVAL = 60
+
+# [Metrics]
+# Upper bounds of the duration histograms, seconds
+METRICS_BUCKETS = [0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+
+# [Profiling]
+# The stack of the code blocking the event loop longer than that many seconds is logged
+LOOP_LAG_THRESHOLD = 0.5
+LOOP_WATCHDOG_INTERVAL = 0.1
+# /profile samples the stacks every PROFILE_INTERVAL seconds for up to PROFILE_MAX_SECONDS
+PROFILE_INTERVAL = 0.005
+PROFILE_DEFAULT_SECONDS = 10
+PROFILE_MAX_SECONDS = 120
+# Functions listed in every table of the report
+PROFILE_TOP = 30
 
 # [Datetime]
 DATETIME_FMT = '%Y-%m-%d-%H-%M-%S'
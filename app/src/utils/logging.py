@@ -1,19 +1,119 @@
-"""Configuring logging."""
+"""Configuring logging.
 
+Records are put to a queue by the `QueueHandler` of the root logger, the
+`QueueListener` thread formats them and writes them to the stream and files,
+so the event loop never waits for the output.
+"""
+
+import atexit
+import copy
+import itertools
+import json
 import logging
 import logging.handlers
+import queue
 
 from datetime import datetime, UTC
 from pathlib import Path
 
-from .constants import DATETIME_FMT, UPDATE_TIME, UPDATE_INTERVAL, LOG_FMT, LOG_LEVEL
+from .constants import (
+    DATETIME_FMT,
+    UPDATE_TIME,
+    UPDATE_INTERVAL,
+    KEEP_OLD_LOGS,
+    LOG_FMT,
+    LOG_LEVEL,
+    LOG_JSON,
+    LOG_QUEUE_SIZE,
+    LOG_SAMPLE_EVERY,
+    LOG_SAMPLED_EVENTS,
+    LOG_SAMPLED_LOGGERS,
+)
+
+# Attributes of every LogRecord, the other ones are the `extra` fields
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record with the `extra` fields as keys."""
+
+    def format(self, record):
+        data = {
+            'time': datetime.fromtimestamp(record.created, UTC).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                data[key] = value
+        if record.exc_info:
+            data['exc_info'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            data['exc_info'] = record.exc_text
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Keep one of every `every` records of the high-volume events.
+
+    A record is sampled if it is logged with `extra={'event': <name>}` of one
+    of the `events` or by one of the `loggers`, the counting is done per event
+    or logger. Warnings and errors are always kept.
+    """
+
+    def __init__(self, every=LOG_SAMPLE_EVERY, events=LOG_SAMPLED_EVENTS, loggers=LOG_SAMPLED_LOGGERS):
+        super().__init__()
+        self.every = every
+        self.events = set(events)
+        self.loggers = set(loggers)
+        self._counters = {}
+
+    def filter(self, record):
+        if self.every <= 1 or record.levelno >= logging.WARNING:
+            return True
+        event = getattr(record, 'event', None)
+        if event in self.events:
+            key = event
+        elif record.name in self.loggers:
+            key = record.name
+        else:
+            return True
+        counter = self._counters.get(key)
+        if counter is None:
+            counter = self._counters[key] = itertools.count()
+        number = next(counter)
+        if number % self.every:
+            return False
+        record.sampled_every = self.every
+        return True
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Drops the records instead of blocking the caller when the queue is full."""
+
+    def prepare(self, record):
+        # Only the message is rendered by the caller, the listener formats the rest
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass
 
 
 def logger_init(log_dir=None):
+    """Route all the records through a queue to the stream and the log files.
 
-    # Get logger
-    logger = logging.getLogger()
-    logger.setLevel(LOG_LEVEL)
+    :param log_dir: str | Path  Directory of the log files, no files are written if None.
+    :return: QueueListener  Started listener, it is stopped at exit.
+    """
+    formatter = JsonFormatter() if LOG_JSON else logging.Formatter(LOG_FMT)
+    handlers = []
 
     # File handler
     if log_dir:
@@ -25,20 +125,32 @@ def logger_init(log_dir=None):
         file = logging.handlers.TimedRotatingFileHandler(
             log_dir.joinpath(log_filename),
             when=UPDATE_TIME,
-            interval=UPDATE_INTERVAL
+            interval=UPDATE_INTERVAL,
+            backupCount=KEEP_OLD_LOGS,
+            encoding='utf-8'
         )
-        file_format = logging.Formatter(LOG_FMT)
         file.setLevel(LOG_LEVEL)
-        file.setFormatter(file_format)
-
-        # Adding all handlers to the logs
-        logger.addHandler(file)
+        file.setFormatter(formatter)
+        handlers.append(file)
 
     # Stream handler
     stream = logging.StreamHandler()
-    stream_format = logging.Formatter(LOG_FMT)
     stream.setLevel(LOG_LEVEL)
-    stream.setFormatter(stream_format)
+    stream.setFormatter(formatter)
+    handlers.append(stream)
+
+    # Get logger
+    logger = logging.getLogger()
+    logger.setLevel(LOG_LEVEL)
+    for handler in logger.handlers[:]:
+        logger.removeHandler(handler)
+
+    # The calling thread only puts the record to the queue
+    queue_handler = _QueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+    queue_handler.addFilter(SamplingFilter())
+    logger.addHandler(queue_handler)
 
-    # Adding all handlers to the logs
-    logger.addHandler(stream)
+    listener = logging.handlers.QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
@@ -0,0 +1,26 @@
+"""Adaptive polling interval."""
+
+from .constants import POLL_MIN_INTERVAL, POLL_MAX_INTERVAL, POLL_BACKOFF
+
+
+class AdaptiveInterval:
+
+    def __init__(self, min_interval=POLL_MIN_INTERVAL, max_interval=POLL_MAX_INTERVAL, backoff=POLL_BACKOFF):
+        """Poll often right after changes and back off while idle.
+
+        :param min_interval: float  Interval after a change, seconds.
+        :param max_interval: float  Upper bound of the interval, seconds.
+        :param backoff: float  Interval multiplier applied on every idle poll.
+        """
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.current = min_interval
+
+    def next(self, changed: bool) -> float:
+        """Return the delay before the next poll."""
+        if changed:
+            self.current = self.min_interval
+        else:
+            self.current = min(self.max_interval, self.current * self.backoff)
+        return self.current
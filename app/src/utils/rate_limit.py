@@ -0,0 +1,86 @@
+"""Rate limiting of the API calls."""
+
+import asyncio
+import threading
+import time
+
+
+class TokenBucket:
+
+    def __init__(self, rate, capacity=None):
+        """Allow `rate` calls per second on average with bursts up to `capacity` calls.
+
+        :param rate: float  Tokens added per second.
+        :param capacity: int  Max number of the stored tokens, `rate` by default.
+        """
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Wait until a call is allowed."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._blocked_until:
+                    await asyncio.sleep(self._blocked_until - now)
+                    continue
+
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds):
+        """Block all the calls for `seconds`, e.g. on the `retry_after` of a flood error."""
+        self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+
+class ThreadTokenBucket:
+
+    def __init__(self, rate, capacity=None):
+        """Thread-safe `TokenBucket` for the blocking calls made in the worker threads.
+
+        :param rate: float  Tokens added per second.
+        :param capacity: int  Max number of the stored tokens, `rate` by default.
+        """
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout=None) -> bool:
+        """Wait until a call is allowed.
+
+        :param timeout: float  Max seconds to wait, forever if None.
+        :return: bool  Whether the call is allowed, False if the timeout has passed.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self._blocked_until:
+                    delay = self._blocked_until - now
+                else:
+                    self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                    self._updated = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return True
+                    delay = (1 - self._tokens) / self.rate
+
+            if deadline is not None and now + delay > deadline:
+                return False
+            time.sleep(delay)
+
+    def pause(self, seconds):
+        """Block all the calls for `seconds`, e.g. on a rate limit error."""
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
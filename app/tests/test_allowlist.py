@@ -0,0 +1,41 @@
+"""Admin usernames of `Allowlist` and the keyboard deleting them.
+
+    python -m unittest discover tests
+"""
+
+import tempfile
+import unittest
+from pathlib import Path
+
+from benchmarks.fakes import install_offline_config
+
+install_offline_config()
+
+from src.tgbot.allowlist import Allowlist  # noqa: E402
+from src.tgbot.keyboards import AdminListKeyboards  # noqa: E402
+
+
+class AllowlistTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = Path(self.directory.name) / 'allowed_usernames'
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_invalid_usernames_are_not_added(self):
+        allowlist = Allowlist(self.path)
+        self.assertEqual(allowlist.add(['@Alice', 'a:b', 'x' * 33, 'bob']), 2)
+        self.assertEqual(allowlist.usernames(), ('alice', 'bob'))
+
+    def test_page_skips_unpackable_usernames(self):
+        # Added to the file by hand
+        self.path.write_text('alice\na:b\n' + 'x' * 60 + '\nbob\n', encoding='utf-8')
+        keyboard = AdminListKeyboards(per_page=10).page(Allowlist(self.path))
+        texts = [row[0].text for row in keyboard.inline_keyboard]
+        self.assertEqual(texts[:-1], ['@bob', '@alice'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+"""Edited rows pushed to `GroupReconciler.apply_rows`, with the fake Sheets API and bot.
+
+    python -m unittest discover tests
+"""
+
+import unittest
+from unittest import mock
+
+from benchmarks.fakes import (
+    FakeBot,
+    FakeSheetsService,
+    install_offline_config,
+    install_service_account,
+    member_rows,
+    offline_service_account,
+)
+
+install_offline_config()
+service_account = offline_service_account(FakeSheetsService([]))
+install_service_account(service_account)
+
+from src import restricted  # noqa: E402
+from src.groups import Group  # noqa: E402
+
+
+class ApplyRowsTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        # The second member is restricted by the flag, without a deposit
+        self.service = FakeSheetsService(member_rows(2, restricted_every=1000, deposit_every=1000))
+        self.service.rows[2][5] = 1
+        sa = offline_service_account(self.service)
+        patcher = mock.patch.object(restricted, 'sa', sa)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.chat_id = -1001
+        restricted.store.update(self.chat_id, unrestricted=restricted.store.load(self.chat_id))
+        self.reconciler = restricted.GroupReconciler(Group(self.chat_id, 'apply-rows'))
+        self.bot = FakeBot()
+        await sa.load_member_index('apply-rows')
+        self.assertTrue(await self.reconciler.check(self.bot))
+        self.user_id = int(self.service.rows[2][0])
+        self.assertIn(self.user_id, self.reconciler.restricted_cache)
+        self.index = sa.member_index('apply-rows')
+
+    async def test_missing_value_is_taken_from_the_index(self):
+        # Only the deposit is pushed, the restricted flag of the sheet stays 1
+        result = await self.reconciler.apply_rows(self.bot, [{'id': self.user_id, 'deposit': 0}])
+
+        self.assertEqual(result, {'restricted': [], 'unrestricted': [], 'failed': []})
+        self.assertIn(self.user_id, self.reconciler.restricted_cache)
+
+    async def test_pushed_values(self):
+        result = await self.reconciler.apply_rows(self.bot, [{'id': self.user_id, 'deposit': 0, 'restricted': 0}])
+
+        self.assertEqual(result['unrestricted'], [self.user_id])
+        self.assertEqual(self.index.get(str(self.user_id)).restricted, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+"""Resolution of the callback data by `CallbackRouter`.
+
+    python -m unittest discover tests
+"""
+
+import unittest
+
+from benchmarks.fakes import install_offline_config
+
+install_offline_config()
+
+from src.tgbot.callbacks import (  # noqa: E402
+    AdminsPageCallback,
+    CallbackRouter,
+    DeleteAdminAction,
+    DeleteAdminCallback,
+    MenuAction,
+    MenuCallback,
+)
+
+
+class RouteNameTest(unittest.TestCase):
+
+    def setUp(self):
+        self.router = CallbackRouter()
+
+        @self.router.on(MenuCallback, MenuAction.CANCEL)
+        async def cancel_action(callback, callback_data, state):
+            pass
+
+        @self.router.on(AdminsPageCallback)
+        async def show_admins_page(callback, callback_data, state):
+            pass
+
+    def test_routed(self):
+        self.assertEqual(self.router.route_name(MenuCallback(action=MenuAction.CANCEL).pack()), 'cancel_action')
+        self.assertEqual(self.router.route_name(AdminsPageCallback(start=10).pack()), 'show_admins_page')
+
+    def test_not_routed(self):
+        self.assertIsNone(self.router.route_name(MenuCallback(action=MenuAction.ADD_ADMINS).pack()))
+        self.assertIsNone(self.router.route_name(
+            DeleteAdminCallback(action=DeleteAdminAction.YES, username='admin').pack()))
+        self.assertIsNone(self.router.route_name(None))
+
+
+if __name__ == '__main__':
+    unittest.main()
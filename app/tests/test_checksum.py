@@ -0,0 +1,62 @@
+"""Sheet checks of `GroupReconciler` with the checksum cell, with the fake Sheets API and bot.
+
+    python -m unittest discover tests
+"""
+
+import unittest
+from unittest import mock
+
+from benchmarks.fakes import (
+    FakeBot,
+    FakeSheetsService,
+    install_offline_config,
+    install_service_account,
+    member_rows,
+    offline_service_account,
+)
+
+install_offline_config()
+install_service_account(offline_service_account(FakeSheetsService([])))
+
+from src import restricted  # noqa: E402
+from src.groups import Group  # noqa: E402
+
+
+class ChecksumTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.service = FakeSheetsService(member_rows(10))
+        self.service.rows[0][6:8] = ['', 1]
+        patcher = mock.patch.object(restricted, 'sa', offline_service_account(self.service))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        chat_id = -1002
+        restricted.store.update(chat_id, unrestricted=restricted.store.load(chat_id))
+        self.reconciler = restricted.GroupReconciler(Group(chat_id, 'checksum'), checksum_cell='H1')
+        self.bot = FakeBot()
+        self.assertTrue(await self.reconciler.check(self.bot))
+
+    async def check(self):
+        self.service.calls.clear()
+        changed = await self.reconciler.check(self.bot)
+        return changed, dict(self.service.calls)
+
+    async def test_unchanged_checksum(self):
+        self.service.rows[2][5] = 1
+        self.assertEqual(await self.check(), (False, {'get': 1}))
+
+    async def test_changed_checksum(self):
+        self.service.rows[2][5] = 1
+        self.service.rows[0][7] = 2
+        self.assertEqual(await self.check(), (True, {'get': 1, 'batchGet': 1}))
+        self.assertIn(int(self.service.rows[2][0]), self.reconciler.restricted_cache)
+
+    async def test_full_check_interval(self):
+        self.service.rows[2][5] = 1
+        with mock.patch.object(restricted, 'POLL_FULL_CHECK_INTERVAL', 0):
+            self.assertEqual(await self.check(), (True, {'get': 1, 'batchGet': 1}))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+"""Leader election over the SQLite lease.
+
+    python -m unittest discover tests
+"""
+
+import asyncio
+import sqlite3
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from benchmarks.fakes import install_offline_config
+
+install_offline_config()
+
+from src.leader import LeaderElection  # noqa: E402
+
+
+class RenewalErrorTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.election = LeaderElection(path=Path(self.directory.name) / 'state.db', ttl=0.5, renew_interval=0.05)
+        self.starts = 0
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    async def job(self):
+        self.starts += 1
+        await asyncio.Event().wait()
+
+    async def run_with_errors(self, seconds):
+        """Run the election, the renewals fail for `seconds` after the first one."""
+        acquire = self.election.try_acquire
+        calls = 0
+
+        def try_acquire():
+            nonlocal calls
+            calls += 1
+            if calls == 1:
+                return acquire()
+            raise sqlite3.OperationalError('database is locked')
+
+        with mock.patch.object(self.election, 'try_acquire', try_acquire):
+            task = asyncio.create_task(self.election.run([self.job]))
+            await asyncio.sleep(seconds)
+            leader = self.election.is_leader
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        return leader
+
+    async def test_jobs_go_on_while_the_lease_is_valid(self):
+        self.assertTrue(await self.run_with_errors(0.3))
+        self.assertEqual(self.starts, 1)
+
+    async def test_jobs_stop_once_the_lease_expires(self):
+        self.assertFalse(await self.run_with_errors(0.7))
+
+
+if __name__ == '__main__':
+    unittest.main()
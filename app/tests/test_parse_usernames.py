@@ -0,0 +1,26 @@
+"""Usernames and ids given to the admin commands.
+
+    python -m unittest discover tests
+"""
+
+import unittest
+
+from benchmarks.fakes import FakeSheetsService, install_offline_config, install_service_account, offline_service_account
+
+install_offline_config()
+install_service_account(offline_service_account(FakeSheetsService([])))
+
+from src.tgbot.handlers import parse_usernames  # noqa: E402
+
+
+class ParseUsernamesTest(unittest.TestCase):
+
+    def test_spaces_and_newlines(self):
+        self.assertEqual(parse_usernames("@alice bob\ncarol\n\n  123 "), ["alice", "bob", "carol", "123"])
+
+    def test_duplicates(self):
+        self.assertEqual(parse_usernames("Alice @alice ALICE bob"), ["Alice", "bob"])
+
+
+if __name__ == '__main__':
+    unittest.main()
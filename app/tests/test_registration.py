@@ -0,0 +1,55 @@
+"""New members registered by a process which is not elected, with the fake Sheets API.
+
+    python -m unittest discover tests
+"""
+
+import tempfile
+import unittest
+from pathlib import Path
+
+from benchmarks.fakes import FakeSheetsService, install_offline_config, member_rows, offline_service_account
+
+install_offline_config()
+
+from src.leader import LeaderElection  # noqa: E402
+from src.registration import MemberRegistrationQueue  # noqa: E402
+from src.state import MemberHandoffStore  # noqa: E402
+
+
+class HandOffTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        path = Path(self.directory.name) / 'state.db'
+        self.service = FakeSheetsService(member_rows(3))
+        handoff = MemberHandoffStore(path)
+
+        leader = LeaderElection(path=path)
+        leader.is_leader = True
+        self.leader = MemberRegistrationQueue(offline_service_account(self.service), 'sheet', chat_id=1,
+                                              election=leader, handoff=handoff)
+        # The fake serves every spreadsheet id from the same rows, another id gives the worker its own index
+        self.worker = MemberRegistrationQueue(offline_service_account(self.service), 'worker-sheet', chat_id=1,
+                                              election=LeaderElection(path=path), handoff=handoff)
+        await self.leader.load_members()
+        await self.worker.load_members()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    async def test_worker_picks_up_saved_members(self):
+        self.assertTrue(self.worker.register(42, 'New Member', 'newbie'))
+        await self.worker.flush()
+        self.assertEqual(len(self.service.rows), 4)
+
+        await self.leader.flush()
+        self.assertEqual(self.service.rows[-1][0], '42')
+
+        await self.worker.flush()
+        self.assertIsNotNone(self.worker.index.get('42'))
+        self.assertIsNotNone(self.worker.index.find('newbie'))
+        self.assertFalse(self.worker.register(42, 'New Member', 'newbie'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,32 @@
+"""Restricted users read by `ServiceAccount.get_restricted_user_ids` from the fake Sheets API.
+
+    python -m unittest discover tests
+"""
+
+import unittest
+
+from benchmarks.fakes import FakeSheetsService, install_offline_config, member_rows, offline_service_account
+
+install_offline_config()
+
+
+class RestrictedUserIdsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.service = FakeSheetsService(member_rows(6, restricted_every=1000, deposit_every=1000))
+        self.sa = offline_service_account(self.service).sync
+        self.rows = self.service.rows
+
+    def test_invalid_cells(self):
+        self.rows[1][4:6] = ['n/a', 0]
+        self.rows[2][4:6] = ['', 'yes']
+        self.rows[3][4:6] = [0, '1.0']
+        self.rows[4][4:6] = ['12.5', 0]
+
+        self.assertEqual(self.sa.get_restricted_user_ids('sheet'), {self.rows[3][0], self.rows[4][0]})
+        # Only the flag of the user restricted by the deposit is switched on
+        self.assertEqual([row[5] for row in self.rows[1:5]], [0, 'yes', '1.0', 1])
+
+
+if __name__ == '__main__':
+    unittest.main()
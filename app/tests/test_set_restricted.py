@@ -0,0 +1,45 @@
+"""Writes of the restricted flags of `ServiceAccount` to a sheet changed behind the member index.
+
+    python -m unittest discover tests
+"""
+
+import unittest
+
+from benchmarks.fakes import FakeSheetsService, install_offline_config, member_rows, offline_service_account
+
+install_offline_config()
+
+
+class SetRestrictedTest(unittest.TestCase):
+
+    def setUp(self):
+        self.service = FakeSheetsService(member_rows(5, restricted_every=1000, deposit_every=1000))
+        self.sa = offline_service_account(self.service).sync
+        self.rows = self.service.rows
+        self.rows[2][2], self.rows[3][2] = 'alice', 'bob'
+        self.sa.load_member_index('sheet')
+
+    def test_unchanged_rows(self):
+        self.assertEqual(self.sa.set_restricted('sheet', ['alice']), {'alice': 'changed'})
+        self.assertEqual(self.rows[2][5], 1)
+        self.assertEqual(self.rows[3][5], 0)
+
+    def test_sorted_rows(self):
+        # The sheet is sorted after the index is loaded
+        self.rows[2], self.rows[3] = self.rows[3], self.rows[2]
+
+        self.assertEqual(self.sa.set_restricted('sheet', ['alice']), {'alice': 'changed'})
+        self.assertEqual((self.rows[3][2], self.rows[3][5]), ('alice', 1))
+        self.assertEqual((self.rows[2][2], self.rows[2][5]), ('bob', 0))
+
+    def test_deleted_row(self):
+        del self.rows[2]
+
+        self.assertEqual(self.sa.set_restricted('sheet', ['bob']), {'bob': 'changed'})
+        self.assertEqual((self.rows[2][2], self.rows[2][5]), ('bob', 1))
+        self.assertEqual(self.rows[3][5], 0)
+        self.assertEqual(self.sa.set_restricted('sheet', ['alice']), {'alice': 'not_found'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+"""Requests of `ServiceAccount` through the Sheets quota guard, with a stub connection.
+
+    python -m unittest discover tests
+"""
+
+import json
+import threading
+import unittest
+from unittest import mock
+
+import httplib2
+from google.auth.credentials import Credentials
+from googleapiclient.discovery import build
+
+from benchmarks.fakes import install_offline_config
+
+install_offline_config()
+
+from src.google_spreadsheets import ServiceAccount  # noqa: E402
+from src.sheets_guard import SheetsGuard, SheetsUnavailable  # noqa: E402
+
+
+class StubCredentials(Credentials):
+
+    def __init__(self):
+        super().__init__()
+        self.token = 'old'
+        self.refreshes = 0
+
+    def refresh(self, request):
+        self.refreshes += 1
+        self.token = 'new'
+
+
+class StubHttp:
+    """Answers 401 to the requests with the old token and 200 to the other ones."""
+
+    def __init__(self):
+        self.requests = []
+        self.lock = threading.Lock()
+
+    def request(self, uri, method='GET', body=None, headers=None, **kwargs):
+        with self.lock:
+            self.requests.append(headers.get('authorization'))
+        if headers.get('authorization') == 'Bearer old':
+            return httplib2.Response({'status': 401}), b'{}'
+        return httplib2.Response({'status': 200}), json.dumps({'values': [['ok']]}).encode()
+
+
+def make_service_account():
+    sa = ServiceAccount.__new__(ServiceAccount)
+    sa.credentials = StubCredentials()
+    sa.scopes = []
+    sa.service = build('sheets', 'v4', static_discovery=True, cache_discovery=False, http=httplib2.Http())
+    sa._local = threading.local()
+    sa.guard = SheetsGuard(retry_delay=0.01, max_retry_delay=0.01)
+    return sa
+
+
+class TokenRefreshTest(unittest.TestCase):
+
+    def read_in_threads(self, sa, stub, count):
+        results = []
+        with mock.patch('src.google_spreadsheets.httplib2.Http', return_value=stub):
+            threads = [threading.Thread(target=lambda: results.append(sa.read_values('sheet', 'E:F')), daemon=True)
+                       for _ in range(count)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(timeout=5)
+        self.assertFalse(any(thread.is_alive() for thread in threads), 'the read hangs')
+        return results
+
+    def test_read_is_repeated_after_401(self):
+        stub = StubHttp()
+        sa = make_service_account()
+        self.assertEqual(self.read_in_threads(sa, stub, 1), [[['ok']]])
+        self.assertEqual(stub.requests, ['Bearer old', 'Bearer new'])
+        self.assertEqual(sa.credentials.refreshes, 1)
+
+    def test_concurrent_reads_after_401(self):
+        stub = StubHttp()
+        sa = make_service_account()
+        self.assertEqual(self.read_in_threads(sa, stub, 4), [[['ok']]] * 4)
+
+
+class SheetStub:
+    """Serves the id, deposit and restricted columns to every read and records the writes."""
+
+    def __init__(self, columns):
+        self.columns = columns
+        self.reads = 0
+        self.writes = []
+
+    def request(self, uri, method='GET', body=None, headers=None, **kwargs):
+        if method == 'GET':
+            self.reads += 1
+            data = {'valueRanges': [{'values': [column]} for column in self.columns]}
+        else:
+            self.writes.append(json.loads(body))
+            data = {}
+        return httplib2.Response({'status': 200}), json.dumps(data).encode()
+
+
+class StaleReadsTest(unittest.TestCase):
+
+    def setUp(self):
+        # A deposit without the flag, the flag is written by a fresh read
+        self.stub = SheetStub([['id', 1, 2], ['deposit', 100, 0], ['restricted', 0, 0]])
+        self.sa = make_service_account()
+        self.sa.credentials.token = 'new'
+        # One read, the next ones are out of the budget
+        self.sa.guard = SheetsGuard(reads_per_minute=0.001, burst=1, max_wait=0)
+        patcher = mock.patch('src.google_spreadsheets.httplib2.Http', return_value=self.stub)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_guard_serves_snapshots_within_stale_reads(self):
+        guard = self.sa.guard
+        send = mock.Mock(return_value=(httplib2.Response({'status': 200}), b'{}'))
+        guard.request(send, 'uri')
+
+        with self.assertRaises(SheetsUnavailable):
+            guard.request(send, 'uri')
+        with guard.stale_reads() as stale:
+            self.assertEqual(guard.request(send, 'uri')[1], b'{}')
+        self.assertTrue(stale.served)
+        self.assertEqual(send.call_count, 1)
+
+    def test_no_write_from_snapshot(self):
+        self.assertEqual(self.sa.get_restricted_user_ids('sheet'), {1})
+        self.assertEqual(len(self.stub.writes), 1)
+
+        # The same read out of the budget is served from the snapshot, nothing is written from it
+        self.assertEqual(self.sa.get_restricted_user_ids('sheet'), {1})
+        self.assertEqual((self.stub.reads, len(self.stub.writes)), (1, 1))
+
+    def test_row_check_is_not_served_from_snapshot(self):
+        self.sa.read_ids('sheet', [2, 3])
+        with self.assertRaises(SheetsUnavailable):
+            self.sa.read_ids('sheet', [2, 3])
+        self.assertEqual(self.stub.reads, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()